@@ -0,0 +1,102 @@
+import logging
+from threading import Lock
+from time import monotonic
+
+from app import constants
+from app.orm_models.repo import ConfigRepo
+
+
+class ActivePollRegistry:
+    """
+    Незавершённые голосования, созданные ботом (идентификатор голосования -> идентификатор чата).
+    Позволяет отбрасывать обновления чужих и уже завершённых голосований до обращения к БД.
+    Голосования, которых нет в реестре (созданные другой репликой), один раз ищутся в БД;
+    отсутствующие там запоминаются на время, чтобы повторные обновления не обращались к БД.
+    """
+    def __init__(self):
+        self.poll_ids: dict[str, int] = {}
+        # идентификатор голосования -> момент (по monotonic), до которого оно считается неизвестным
+        self.unknown: dict[str, float] = {}
+        self.discarded = 0
+        self.lock = Lock()
+
+    def load(self, poll_ids: dict[str, int]):
+        """
+        Заменяет содержимое реестра (при запуске бота).
+        :param poll_ids: Идентификаторы чатов по идентификатору незавершённого голосования
+        """
+        with self.lock:
+            self.poll_ids = dict(poll_ids)
+        logging.info('Loaded %s active polls', len(self.poll_ids))
+
+    def add(self, poll_id: str, chat_id: int):
+        """
+        Добавляет голосование в реестр.
+        :param poll_id: Идентификатор голосования
+        :param chat_id: Идентификатор чата
+        """
+        with self.lock:
+            self.poll_ids[poll_id] = chat_id
+            self.unknown.pop(poll_id, None)
+
+    def discard(self, *poll_ids: str):
+        """
+        Удаляет голосования из реестра.
+        :param poll_ids: Идентификаторы голосований
+        """
+        with self.lock:
+            for poll_id in poll_ids:
+                self.poll_ids.pop(poll_id, None)
+
+    def chat_id_of(self, poll_id: str) -> int | None:
+        """
+        Возвращает чат голосования.
+        :param poll_id: Идентификатор голосования
+        :return: Идентификатор чата либо None, если голосование неизвестно
+        """
+        return self.poll_ids.get(poll_id)
+
+    def accept(self, poll_id: str) -> bool:
+        """
+        Проверяет, нужно ли обрабатывать обновление голосования. Отброшенные
+        обновления подсчитываются.
+        :param poll_id: Идентификатор голосования
+        :return: True - голосование активно, иначе - False
+        """
+        if poll_id in self.poll_ids or self.lookup(poll_id):
+            return True
+        with self.lock:
+            self.discarded += 1
+            discarded = self.discarded
+        logging.debug('Update of unknown or closed poll (poll_id=%s) discarded', poll_id, extra={'poll_id': poll_id})
+        if discarded % constants.DISCARDED_POLL_UPDATES_LOG_EVERY == 0:
+            logging.info('Discarded %s updates of unknown or closed polls', discarded)
+        return False
+
+
+    def lookup(self, poll_id: str) -> bool:
+        """
+        Ищет отсутствующее в реестре голосование в БД одним запросом по индексу и добавляет
+        найденное в реестр. Ненайденные голосования запоминаются на UNKNOWN_POLL_CACHE_SECONDS.
+        :param poll_id: Идентификатор голосования
+        :return: True - голосование активно, иначе - False
+        """
+        now = monotonic()
+        if self.unknown.get(poll_id, 0.0) > now:
+            return False
+        chat_id = ConfigRepo.get_active_poll_chat_id(poll_id)
+        if chat_id is not None:
+            logging.info('Active poll (poll_id=%s) found in db', poll_id,
+                         extra={'poll_id': poll_id, 'chat_id': chat_id})
+            self.add(poll_id, chat_id)
+            return True
+        with self.lock:
+            if len(self.unknown) >= constants.UNKNOWN_POLL_CACHE_SIZE:
+                self.unknown = {key: until for key, until in self.unknown.items() if until > now}
+                if len(self.unknown) >= constants.UNKNOWN_POLL_CACHE_SIZE:
+                    self.unknown.clear()
+            self.unknown[poll_id] = now + constants.UNKNOWN_POLL_CACHE_SECONDS
+        return False
+
+
+active_polls = ActivePollRegistry()
@@ -0,0 +1,139 @@
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+
+from app import constants
+from app.config import db, backup_dir, backup_keep
+from app.leader import holds_leadership, stopping
+
+
+def copy_database(source_path: str, target_path: str) -> float:
+    """
+    Копирует БД через онлайн backup API SQLite за один шаг. Копия делается в одной
+    транзакции чтения, поэтому она согласована и не начинается заново при записи в БД
+    другими соединениями, а в режиме WAL чтение не блокирует запись.
+    :param source_path: Путь к исходной БД
+    :param target_path: Путь к копии
+    :return: Длительность копирования в секундах
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    started_at = monotonic()
+    try:
+        with target:
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return monotonic() - started_at
+
+
+def rotate_backups(directory: str, keep: int):
+    """
+    Удаляет старые резервные копии, оставляя указанное количество последних.
+    :param directory: Каталог с копиями
+    :param keep: Количество хранимых копий
+    """
+    backups = list_backups(directory)
+    for name in backups[:max(len(backups) - keep, 0)]:
+        os.remove(os.path.join(directory, name))
+        logging.info('Old backup %s removed', name)
+
+
+def list_backups(directory: str) -> list[str]:
+    """
+    Возвращает имена файлов резервных копий от старых к новым.
+    :param directory: Каталог с копиями
+    :return: Имена файлов
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith(constants.BACKUP_FILE_PREFIX) and name.endswith(constants.BACKUP_FILE_SUFFIX))
+
+
+def create_backup(directory: str = backup_dir, keep: int = backup_keep) -> str:
+    """
+    Создаёт сжатую резервную копию БД без остановки бота и удаляет старые копии.
+    :param directory: Каталог с копиями
+    :param keep: Количество хранимых копий
+    :return: Путь к созданной копии
+    """
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f'{constants.BACKUP_FILE_PREFIX}{timestamp}{constants.BACKUP_FILE_SUFFIX}')
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, 'snapshot.db')
+        duration = copy_database(db.database, snapshot_path)
+        with open(snapshot_path, 'rb') as snapshot, gzip.open(path + '.part', 'wb') as archive:
+            shutil.copyfileobj(snapshot, archive)
+    os.replace(path + '.part', path)
+    logging.info('Database backup %s created in %.3f s (size %s bytes)', path, duration, os.path.getsize(path))
+    rotate_backups(directory, keep)
+    return path
+
+
+def backup_loop(interval: timedelta):
+    """
+    Периодически создаёт резервную копию БД. Запускать в отдельном потоке: копирование
+    не должно задерживать продление аренды лидерства и завершение голосований.
+    Копию создаёт только реплика-лидер.
+    :param interval: Интервал между копиями
+    """
+    logging.info('Start of backup loop (interval=%s)', interval)
+    while not stopping.wait(interval.total_seconds()):
+        if not holds_leadership():
+            continue
+        try:
+            create_backup()
+        except Exception as e:
+            logging.error('Cannot create database backup: %s', e)
+
+
+def restore_backup(path: str):
+    """
+    Восстанавливает БД из резервной копии. Перед восстановлением копия проверяется
+    (PRAGMA integrity_check). Бот на время восстановления должен быть остановлен.
+    :param path: Путь к сжатой резервной копии
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, 'snapshot.db')
+        with gzip.open(path, 'rb') as archive, open(snapshot_path, 'wb') as snapshot:
+            shutil.copyfileobj(archive, snapshot)
+        connection = sqlite3.connect(snapshot_path)
+        try:
+            result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            connection.close()
+        if result != 'ok':
+            raise sqlite3.DatabaseError(f'Резервная копия повреждена: {result}')
+        duration = copy_database(snapshot_path, db.database)
+    logging.info('Database restored from %s in %.3f s', path, duration)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
+    parser = argparse.ArgumentParser(description='Резервное копирование БД бота')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('create', help='создать резервную копию')
+    commands.add_parser('list', help='показать резервные копии')
+    restore_parser = commands.add_parser('restore', help='восстановить БД из копии (бот должен быть остановлен)')
+    restore_parser.add_argument('path', nargs='?', help='путь к копии (по умолчанию - последняя)')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        create_backup()
+    elif args.command == 'list':
+        print('\n'.join(list_backups(backup_dir)))
+    else:
+        backups = list_backups(backup_dir)
+        if not args.path and not backups:
+            sys.exit('Нет резервных копий в каталоге {}'.format(backup_dir))
+        restore_backup(args.path or os.path.join(backup_dir, backups[-1]))
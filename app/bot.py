@@ -1,22 +1,24 @@
 import logging
 import re
-from datetime import date, timedelta
-from time import sleep
+from datetime import timedelta
 
 from telebot.types import Poll, PollOption
-from app import constants
-from app.config import db, scheduler, bot
+from app import constants, clock
+from app.active_polls import active_polls
+from app.locks import chat_locked, write_transaction
+from app.config import db, bot
 from app.orm_models.models import Member, ChatConfig, TenderParticipant
-from app.utils import set_schedule, get_daily_time_utc, check_poll_results, extract_args, \
-    get_members_for_daily, get_correct_poll_time, try_parse_date
-from orm_models.repo import MemberRepo, ConfigRepo, TenderParticipantRepo
+from app.utils import set_schedule, cancel_schedule, get_daily_time_utc, check_poll_results, extract_args, \
+    extract_names, get_members_for_daily, get_correct_poll_time, try_parse_date, make_roster_row, parse_roster_file, \
+    write_roster_csv, render_members_page, record_single_win
+from orm_models.repo import MemberRepo, ConfigRepo, TenderParticipantRepo, MemberStatsRepo
 
 
 def send_remaining_member_win_message(chat_id, winner, delete_jobs: bool = False):
     """
     В случае, когда остаётся последний участник, который может проводить дейли,
-    отправляет сообщение о победе этого человека без создания голосования. При необходимости
-    удаляет отложенные задачи (отправка победителя голосования с посчётом голосов).
+    отправляет сообщение о победе этого человека без создания голосования и записывает победу.
+    При необходимости удаляет отложенные задачи (отправка победителя голосования с посчётом голосов).
     :param chat_id: Идентификатор чата
     :param winner: Победивший пользователь
     :param delete_jobs: Удалять ли отложенные задачи
@@ -24,12 +26,13 @@ def send_remaining_member_win_message(chat_id, winner, delete_jobs: bool = False
     """
     logging.info("Got just one participant available, poll is not necessary")
     bot.send_message(chat_id, constants.WIN_MESSAGE_TEMPLATE.format(winner.full_name))
-    MemberRepo.update_member(chat_id, winner.full_name, can_participate=False)
+    record_single_win(chat_id, winner)
     if delete_jobs:
-        scheduler.delete_jobs()
+        cancel_schedule(chat_id)
 
 
 @bot.message_handler(commands=["start"])
+@chat_locked(lambda message: message.chat.id)
 def start(message):
     """
     Проводит первичную инициализацию конфигурации чата.
@@ -45,18 +48,8 @@ def start(message):
             bot.send_message(chat_id, f"Произошла ошибка при создании первичной конфигурации чата: {e}")
 
 
-def schedule_checker():
-    """
-    Проверяет и запускает отложенные задачи. Запускать в отдельном потоке.
-    """
-    logging.info('Start of schedule loop to execute jobs on separate thread')
-    while len(scheduler.get_jobs()) > 0:
-        scheduler.exec_jobs()
-        sleep(1)
-    logging.info('Schedule loop shut down successfully')
-
-
 @bot.message_handler(commands=["start"])
+@chat_locked(lambda message: message.chat.id)
 def start(message):
     """
     Проводит первичную инициализацию конфигурации чата.
@@ -73,83 +66,166 @@ def start(message):
 
 
 @bot.message_handler(commands=["add"])
+@chat_locked(lambda message: message.chat.id)
 def add(message):
     """
-    Добавляет пользователя. В сообщении после команды должно быть имя пользователя.
+    Добавляет пользователей. В сообщении после команды должно быть имя пользователя,
+    несколько имён разделяются запятой или переводом строки.
     :param message: Сообщение с командой
     """
-    with db.atomic() as transaction:
+    chat_id = message.chat.id
+    with write_transaction() as transaction:
         try:
-            chat_id = message.chat.id
-            name = extract_args(message.text, 1)[0].replace('"', '')
-            MemberRepo.add_member(full_name=name, chat_id=chat_id)
-            bot.send_message(message.chat.id, 'Пользователь "{}" успешно добавлен'.format(name))
+            names = extract_names(message.text)
+            if not names:
+                raise ValueError('Укажите имя пользователя после команды. Несколько имён разделяйте запятой '
+                                 'или переводом строки')
+            if len(names) == 1:
+                MemberRepo.add_member(full_name=names[0], chat_id=chat_id)
+                reply = 'Пользователь "{}" успешно добавлен'.format(names[0])
+            else:
+                total, added = MemberRepo.add_members(chat_id, filter(None, map(make_roster_row, names)))
+                reply = f'Добавлено пользователей: {added} из {total} (остальные уже есть в чате)'
         except Exception as e:
             transaction.rollback()
-            bot.send_message(message.chat.id, f"Произошла ошибка при добавлении пользователя: {e}")
+            reply = f"Произошла ошибка при добавлении пользователя: {e}"
+    bot.send_message(chat_id, reply)
+
+
+@bot.message_handler(content_types=["document"],
+                     func=lambda message: (message.caption or '').startswith('/import'))
+@chat_locked(lambda message: message.chat.id)
+def import_members(message):
+    """
+    Импортирует пользователей из CSV- или JSON-файла, отправленного с подписью /import.
+    Уже существующие пользователи пропускаются. Файл скачивается до начала транзакции.
+    :param message: Сообщение с документом
+    """
+    chat_id = message.chat.id
+    try:
+        file_info = bot.get_file(message.document.file_id)
+        content = bot.download_file(file_info.file_path)
+        with write_transaction():
+            rows = parse_roster_file(content, message.document.file_name or '')
+            total, added = MemberRepo.add_members(chat_id, rows)
+        reply = f'Импорт завершён: добавлено {added} из {total} пользователей'
+    except Exception as e:
+        reply = f"Произошла ошибка при импорте пользователей: {e}"
+    bot.send_message(chat_id, reply)
+
+
+@bot.message_handler(commands=["export"])
+def export_members(message):
+    """
+    Отправляет CSV-файл с пользователями чата и их статусами.
+    :param message: Сообщение с командой
+    """
+    chat_id = message.chat.id
+    try:
+        with db.atomic():
+            document = write_roster_csv(MemberRepo.iter_members_for_export(chat_id))
+        bot.send_document(chat_id, document, visible_file_name='members.csv')
+    except Exception as e:
+        bot.send_message(chat_id, f"Произошла ошибка при выгрузке пользователей: {e}")
 
 
 @bot.message_handler(commands=["delete"])
+@chat_locked(lambda message: message.chat.id)
 def delete(message):
     """
     Удаляет пользователя. В сообщении после команды должно быть имя или id пользователя.
     :param message: Сообщение с командой
     """
-    with db.atomic() as transaction:
+    chat_id = message.chat.id
+    with write_transaction() as transaction:
         try:
             identity = extract_args(message.text, 1)[0].replace('"', '')
-            chat_id = message.chat.id
             MemberRepo.delete_member(identity=identity, chat_id=chat_id)
-            bot.send_message(message.chat.id, 'Пользователь с идентификатором "{}" успешно удалён'
-                             .format(identity))
+            reply = 'Пользователь с идентификатором "{}" успешно удалён'.format(identity)
         except Exception as e:
             transaction.rollback()
-            bot.send_message(message.chat.id, f"Произошла ошибка при удалении пользователя: {e}")
+            reply = f"Произошла ошибка при удалении пользователя: {e}"
+    bot.send_message(chat_id, reply)
 
 
 @bot.message_handler(commands=["info"])
 def chat_info(message):
     """
-    Отправляет информацию об пользователях их доступности для участия в голосовании.
+    Отправляет первую страницу информации об пользователях их доступности для участия в голосовании.
     :param message: Сообщение с командой
     :return:
     """
-    with db.atomic() as transaction:
-        try:
-            chat_id = message.chat.id
-            members = MemberRepo.get_members_by_chat_id(chat_id=chat_id)
-            res = 'Встречайте участников тендера:\n'
-            for index, member in enumerate(list(members), 1):
-                res += f'{index}. {member.get_status_emoji()} {member.full_name} ' \
-                       f'(id={member.id}{member.availability_info()})\n'
-            bot.send_message(chat_id, res)
-        except Exception as e:
-            transaction.rollback()
-            bot.send_message(message.chat.id, f"Произошла ошибка при получении пользователей: {e}")
+    chat_id = message.chat.id
+    try:
+        with db.atomic():
+            text, markup = render_members_page(chat_id)
+        bot.send_message(chat_id, text, reply_markup=markup)
+    except Exception as e:
+        bot.send_message(chat_id, f"Произошла ошибка при получении пользователей: {e}")
+
+
+@bot.callback_query_handler(func=lambda call: (call.data or '').startswith(constants.INFO_CALLBACK_PREFIX + ':'))
+def chat_info_page(call):
+    """
+    Переключает страницу списка пользователей, редактируя исходное сообщение.
+    :param call: Нажатие на кнопку перехода между страницами
+    """
+    chat_id = call.message.chat.id
+    try:
+        _, direction, cursor = call.data.split(':')
+        with db.atomic():
+            if direction == 'prev':
+                text, markup = render_members_page(chat_id, before_id=int(cursor))
+            else:
+                text, markup = render_members_page(chat_id, after_id=int(cursor))
+        bot.edit_message_text(text, chat_id, call.message.id, reply_markup=markup)
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        bot.answer_callback_query(call.id, f"Ошибка при получении пользователей: {e}")
+
+
+@bot.message_handler(commands=["stats"])
+def chat_stats(message):
+    """
+    Отправляет накопительную статистику участников по завершённым тендерам.
+    :param message: Сообщение с командой
+    """
+    chat_id = message.chat.id
+    try:
+        rows = MemberStatsRepo.get_chat_stats(chat_id=chat_id)
+        lines = ['Статистика тендеров (побед / номинаций / голосов):']
+        for index, (full_name, times_nominated, times_won, total_votes) in enumerate(rows, 1):
+            lines.append(f'{index}. {full_name}: {times_won} / {times_nominated} / {total_votes}')
+        bot.send_message(chat_id, '\n'.join(lines))
+    except Exception as e:
+        bot.send_message(chat_id, f"Произошла ошибка при получении статистики: {e}")
 
 
 @bot.message_handler(commands=["free"])
+@chat_locked(lambda message: message.chat.id)
 def free(message):
     """
     Освобождает пользователя от участия в тендерах до указанной даты
     :param message: Сообщение с командой
     """
-    with db.atomic() as transaction:
+    chat_id = message.chat.id
+    with write_transaction() as transaction:
         try:
-            chat_id = message.chat.id
             args: list[str] = extract_args(message.text, 2)
             full_name = args[0].replace('"', '')
             parsed_date = try_parse_date(args[1])
             MemberRepo.update_member(chat_id=chat_id,
                                      full_name=full_name,
                                      skip_until_date=parsed_date)
-            bot.send_message(chat_id, f"{full_name} освобождён от тендеров до {parsed_date.strftime('%d.%m.%Y')}")
+            reply = f"{full_name} освобождён от тендеров до {parsed_date.strftime('%d.%m.%Y')}"
         except Exception as e:
             transaction.rollback()
-            bot.send_message(chat_id, f"Ошибка исполнения команды: {e}")
+            reply = f"Ошибка исполнения команды: {e}"
+    bot.send_message(chat_id, reply)
 
 
 @bot.message_handler(commands=["poll"])
+@chat_locked(lambda message: message.chat.id)
 def create_poll(message):
     """
     Запускает голосование из трёх случайно выбранных пользователей на указанное время.
@@ -158,7 +234,8 @@ def create_poll(message):
     :param message: Сообщение с командой
     """
     sent_message = None
-    with db.atomic() as transaction:
+    created_poll_id = None
+    with write_transaction() as transaction:
         try:
             chat_id = message.chat.id
             time_str = extract_args(message.text, 1)[0]
@@ -196,17 +273,23 @@ def create_poll(message):
             set_schedule(time=daily_time, chat_id=chat_id)
 
             ConfigRepo.update_config(chat_id=chat_id,
-                                     last_daily_date=date.today(),
+                                     last_daily_date=clock.today(),
                                      last_poll_id=poll_id,
                                      last_poll_message_id=sent_message.id)
+            created_poll_id = poll_id
         except Exception as e:
             transaction.rollback()
             if sent_message:
                 bot.delete_message(chat_id, sent_message.id)
             bot.send_message(message.chat.id, f"Произошла ошибка при создании опроса: {e}")
 
+    # реестр меняется только после фиксации транзакции
+    if created_poll_id:
+        active_polls.add(created_poll_id, chat_id)
+
 
 @bot.message_handler(commands=["repoll"])
+@chat_locked(lambda message: message.chat.id)
 def recreate_poll(message):
     """
     Перезапускает голосование. Убирает из предыдущего голосования одного человека
@@ -215,7 +298,8 @@ def recreate_poll(message):
     :param message: Сообщение с командой
     """
     sent_message = None
-    with db.atomic() as transaction:
+    closed_poll_id, created_poll_id = None, None
+    with write_transaction() as transaction:
         try:
             chat_id: int = message.chat.id
 
@@ -252,54 +336,68 @@ def recreate_poll(message):
 
             MemberRepo.update_member(chat_id=chat_id,
                                      full_name=dropped_member_name,
-                                     skip_until_date=date.today() + timedelta(days=1))
+                                     skip_until_date=clock.today() + timedelta(days=1))
 
             if len(new_tender_member_names) == 1:
                 winner = new_tender_members[0]
                 send_remaining_member_win_message(chat_id, winner, True)
-                return
-
-            sent_message = bot.send_poll(chat_id=chat_id,
-                                         options=new_tender_member_names,
-                                         question=constants.POLL_HEADER)
-
-            poll_id = sent_message.poll.id
-            TenderParticipantRepo.delete_participants(chat_id)
-            TenderParticipantRepo.add_participants(poll_id, new_tender_members)
-
-            ConfigRepo.update_config(chat_id,
-                                     last_poll_id=poll_id,
-                                     last_poll_message_id=sent_message.id)
-            bot.delete_message(chat_id, config.last_poll_message_id)
+                closed_poll_id = config.last_poll_id
+            else:
+                sent_message = bot.send_poll(chat_id=chat_id,
+                                             options=new_tender_member_names,
+                                             question=constants.POLL_HEADER)
+
+                poll_id = sent_message.poll.id
+                TenderParticipantRepo.delete_participants(chat_id)
+                TenderParticipantRepo.add_participants(poll_id, new_tender_members)
+
+                ConfigRepo.update_config(chat_id,
+                                         last_poll_id=poll_id,
+                                         last_poll_message_id=sent_message.id)
+                bot.delete_message(chat_id, config.last_poll_message_id)
+                closed_poll_id, created_poll_id = config.last_poll_id, poll_id
 
         except Exception as e:
             transaction.rollback()
+            closed_poll_id, created_poll_id = None, None
             if sent_message:
                 bot.delete_message(chat_id, sent_message.id)
             bot.send_message(message.chat.id, f"Произошла ошибка при пересоздании опроса: {e}")
 
+    # реестр меняется только после фиксации транзакции
+    if closed_poll_id:
+        active_polls.discard(closed_poll_id)
+    if created_poll_id:
+        active_polls.add(created_poll_id, chat_id)
+
 
-@bot.poll_handler(lambda poll: not poll.is_closed)
+@bot.poll_handler(lambda poll: not poll.is_closed and active_polls.accept(poll.id))
+@chat_locked(lambda poll: active_polls.chat_id_of(poll.id))
 def vote_answer_handler(poll: Poll):
     """
     Хэндлер, реагирующий на выборы в голосовании. Записывает голоса
     участников голосования в БД.
     :param poll: Объект голосования
     """
-    with db.atomic() as transaction:
+    with write_transaction() as transaction:
         try:
             poll_id: str = poll.id
-            logging.info('Updating vote counts of daily tender poll (poll_id={0})'.format(poll_id))
+            logging.info('Updating vote counts of daily tender poll (poll_id=%s)', poll_id,
+                         extra={'poll_id': poll_id, 'event': 'vote_update'})
             options: list[PollOption] = poll.options
             for option in options:
                 member = MemberRepo.get_member_by_full_name(option.text)
                 TenderParticipantRepo.update_participant_vote_count(poll_id, member, option.voter_count)
-            logging.info('Successfully updated vote counts of daily tender poll (poll_id={0})'.format(poll_id))
+            logging.info('Successfully updated vote counts of daily tender poll (poll_id=%s)', poll_id,
+                         extra={'poll_id': poll_id, 'event': 'vote_update'})
         except Exception as e:
             transaction.rollback()
+            logging.warning('Cannot update vote counts of poll (poll_id=%s): %s', poll.id, e,
+                            extra={'poll_id': poll.id})
 
 
 @bot.message_handler(commands=["endpoll"])
+@chat_locked(lambda message: message.chat.id)
 def end_poll(message):
     chat_id = message.chat.id
 
@@ -310,6 +408,6 @@ def end_poll(message):
         return
 
     logging.info("Premature closing of poll in chat (id={})".format(chat_id))
-    scheduler.delete_jobs()
+    cancel_schedule(chat_id)
     check_poll_results(chat_id)
     logging.info("Poll in chat (id={}) successfully closed".format(chat_id))
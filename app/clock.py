@@ -0,0 +1,79 @@
+from datetime import date, datetime, timedelta, timezone
+
+
+class SystemClock:
+    """
+    Часы, возвращающие реальное время
+    """
+    def now(self) -> datetime:
+        """
+        :return: Текущее время по UTC
+        """
+        return datetime.now(timezone.utc)
+
+    def today(self) -> date:
+        """
+        :return: Текущая дата
+        """
+        return date.today()
+
+
+class VirtualClock:
+    """
+    Часы с виртуальным временем, которое меняется только вызовами advance/set
+    (для симуляции и тестов)
+    """
+    def __init__(self, start: datetime):
+        self.current = start.astimezone(timezone.utc)
+
+    def now(self) -> datetime:
+        """
+        :return: Текущее виртуальное время по UTC
+        """
+        return self.current
+
+    def today(self) -> date:
+        """
+        :return: Текущая виртуальная дата
+        """
+        return self.current.date()
+
+    def advance(self, delta: timedelta):
+        """
+        Переводит время вперёд.
+        :param delta: Интервал
+        """
+        self.current += delta
+
+    def set(self, moment: datetime):
+        """
+        Устанавливает время.
+        :param moment: Новое время
+        """
+        self.current = moment.astimezone(timezone.utc)
+
+
+current = SystemClock()
+
+
+def set_clock(clock):
+    """
+    Подменяет источник времени для моделей, репозиториев и планировщика.
+    :param clock: Объект с методами now() и today()
+    """
+    global current
+    current = clock
+
+
+def now() -> datetime:
+    """
+    :return: Текущее время по UTC
+    """
+    return current.now()
+
+
+def today() -> date:
+    """
+    :return: Текущая дата
+    """
+    return current.today()
@@ -1,18 +1,46 @@
 import os
+import socket
+import uuid
+
 import telebot
 
 from datetime import timezone
 from peewee import *
 from scheduler import Scheduler
 
-bot_token = os.environ["BOT_TOKEN"]
+# токен нужен только боту: служебные команды (python -m app.backup и т.п.) запускаются без него
+bot_token = os.environ.get("BOT_TOKEN", "")
 
-bot = telebot.TeleBot(bot_token)
+# собственный пул потоков бота не используется: хэндлеры выполняются пулом из app/updates.py,
+# который сохраняет порядок обновлений чата и сохраняет смещение после выполнения хэндлеров
+bot = telebot.TeleBot(bot_token, threaded=False, validate_token=bool(bot_token))
 db = SqliteDatabase(
-        os.path.join(
+        os.environ.get("DB_PATH") or os.path.join(
                 os.path.dirname(os.path.realpath(__file__)),
                 'database',
                 'main.db'
-        )
+        ),
+        # WAL и ожидание блокировки нужны для работы нескольких реплик с одним файлом БД
+        # (транзакции, которые пишут после чтения, - app.locks.write_transaction)
+        pragmas={'journal_mode': 'wal', 'busy_timeout': 5000}
 )
 scheduler = Scheduler(tzinfo=timezone.utc, n_threads=0)
+
+# идентификатор реплики для выбора лидера, выполняющего отложенные задачи
+replica_id = os.environ.get("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# получение обновлений через long polling: Telegram разрешает только одного получателя getUpdates
+# на токен, поэтому на остальных репликах нужно указать RUN_POLLING=0
+run_polling_enabled = os.environ.get("RUN_POLLING", "1") != "0"
+
+# срок хранения архива голосований в днях
+history_retention_days = int(os.environ.get("HISTORY_RETENTION_DAYS", "365"))
+
+# формат логов: "text" либо "json"
+log_format = os.environ.get("LOG_FORMAT", "text")
+# запись логов в stdout через фоновый поток
+log_async = os.environ.get("LOG_ASYNC", "1") != "0"
+
+# резервные копии БД: каталог, количество хранимых копий и интервал (0 - не создавать)
+backup_dir = os.environ.get("BACKUP_DIR") or os.path.join(os.path.dirname(db.database), 'backups')
+backup_keep = int(os.environ.get("BACKUP_KEEP", "7"))
+backup_interval_hours = float(os.environ.get("BACKUP_INTERVAL_HOURS", "24"))
@@ -4,3 +4,62 @@ WIN_MESSAGE_TEMPLATE = '{}, настало твоё время, ты был(а)
 # время проведения по UTC
 DEFAULT_DAILY_HOURS = 6
 DEFAULT_DAILY_MINUTES = 25
+
+# частота записи частых событий в лог: пишется каждая N-я запись
+LOG_SAMPLING_RATES = {
+    'vote_update': 20,
+}
+
+# интервал запуска очистки архива голосований
+HISTORY_RETENTION_INTERVAL_SECONDS = 24 * 60 * 60
+
+# размер пачки для insert_many (с запасом под лимит переменных SQLite)
+INSERT_BATCH_SIZE = 200
+# колонки файла со списком пользователей
+ROSTER_FIELDS = ('full_name', 'can_participate', 'skip_until_date')
+
+# параллельная отправка сообщений при одновременном завершении голосований
+SENDER_POOL_SIZE = 8
+# ограничение Telegram - около 30 сообщений в секунду на бота
+SENDER_RATE_PER_SECOND = 25
+SENDER_MAX_RETRIES = 3
+
+# выбор лидера среди реплик для выполнения отложенных задач
+SCHEDULER_LEASE_NAME = 'scheduler'
+SCHEDULER_LEASE_SECONDS = 5
+# запас до истечения аренды, после которого реплика перестаёт считать себя лидером
+SCHEDULER_LEASE_MARGIN_SECONDS = 1
+SCHEDULER_HEARTBEAT_SECONDS = 1
+SCHEDULER_TICK_SECONDS = 1
+# повтор завершения голосований после ошибки
+POLL_CLOSE_RETRY_SECONDS = 60
+
+# получение обновлений Telegram
+UPDATE_OFFSET_STATE = 'last_update_id'
+# снимки голосований, перенесённые между пачками при догонке очереди обновлений
+UPDATE_CARRIED_POLLS_STATE = 'carried_poll_updates'
+UPDATES_BATCH_LIMIT = 100
+UPDATES_LONG_POLLING_TIMEOUT = 20
+UPDATES_RETRY_SECONDS = 3
+# потоки хэндлеров: делитель CHAT_LOCK_STRIPES, чтобы разные потоки не делили полосу блокировок чатов
+UPDATE_WORKERS = 8
+
+# размер страницы списка участников (/info), с запасом под лимит сообщения Telegram в 4096 символов
+INFO_PAGE_SIZE = 25
+INFO_CALLBACK_PREFIX = 'info'
+
+# резервные копии БД
+BACKUP_FILE_PREFIX = 'main-'
+BACKUP_FILE_SUFFIX = '.db.gz'
+
+# как часто писать в лог количество отброшенных обновлений неизвестных голосований
+DISCARDED_POLL_UPDATES_LOG_EVERY = 100
+# сколько помнить голосования, не найденные в БД, и сколько таких голосований хранить
+UNKNOWN_POLL_CACHE_SECONDS = 60
+UNKNOWN_POLL_CACHE_SIZE = 10000
+
+# блокировки чатов: количество полос и время ожидания, после которого пишется предупреждение
+CHAT_LOCK_STRIPES = 64
+CHAT_LOCK_WAIT_WARNING_SECONDS = 0.5
+# как часто писать в лог статистику ожидания блокировок чатов
+CHAT_LOCK_STATS_INTERVAL_SECONDS = 10 * 60
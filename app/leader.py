@@ -0,0 +1,83 @@
+import logging
+from functools import wraps
+from threading import Event, Lock
+from time import monotonic
+
+from app import constants
+from app.config import db, replica_id
+from app.orm_models.repo import LeaseRepo
+
+# момент (по monotonic), до которого реплика гарантированно остаётся лидером
+leader_until = 0.0
+stopping = Event()
+# продление и освобождение аренды не должны выполняться одновременно
+lease_lock = Lock()
+
+
+def holds_leadership() -> bool:
+    """
+    Проверяет, является ли реплика лидером. Срок считается по локальным часам от момента
+    последнего продления аренды с запасом, поэтому приостановленная реплика не будет
+    считать себя лидером после истечения аренды.
+    :return: True - реплика является лидером, иначе - False
+    """
+    return monotonic() < leader_until
+
+
+def lease_heartbeat():
+    """
+    Захватывает и продлевает аренду лидерства. Запускать в отдельном потоке на каждой
+    реплике: продление не должно зависеть от длительности завершения голосований и
+    периодических задач.
+    """
+    global leader_until
+    logging.info('Start of leader lease heartbeat (replica=%s)', replica_id)
+    was_leader = False
+    while not stopping.is_set():
+        try:
+            with lease_lock:
+                if stopping.is_set():
+                    break
+                started_at = monotonic()
+                with db.atomic():
+                    leader = LeaseRepo.try_acquire(constants.SCHEDULER_LEASE_NAME, replica_id,
+                                                   constants.SCHEDULER_LEASE_SECONDS)
+                leader_until = started_at + constants.SCHEDULER_LEASE_SECONDS \
+                    - constants.SCHEDULER_LEASE_MARGIN_SECONDS if leader else 0.0
+            if leader != was_leader:
+                logging.info('Replica %s %s scheduler leadership', replica_id, 'acquired' if leader else 'lost')
+                was_leader = leader
+        except Exception as e:
+            logging.error('Cannot renew leader lease: %s', e)
+        stopping.wait(constants.SCHEDULER_HEARTBEAT_SECONDS)
+
+
+def release_leadership():
+    """
+    Останавливает продление аренды и освобождает её при остановке реплики, чтобы другая
+    реплика стала лидером без ожидания истечения срока аренды.
+    """
+    global leader_until
+    stopping.set()
+    with lease_lock:
+        if holds_leadership():
+            leader_until = 0.0
+            with db.atomic():
+                LeaseRepo.release(constants.SCHEDULER_LEASE_NAME, replica_id)
+            logging.info('Replica %s released scheduler leadership', replica_id)
+
+
+def leader_only(job):
+    """
+    Декоратор периодической задачи: задача выполняется, только если реплика
+    остаётся лидером на момент запуска.
+    :param job: Задача
+    :return: Задача с проверкой лидерства
+    """
+    @wraps(job)
+    def wrapper(*args, **kwargs):
+        if not holds_leadership():
+            logging.info('Job %s skipped: replica %s is not the scheduler leader', job.__name__, replica_id)
+            return None
+        return job(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,144 @@
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+from time import sleep, time
+
+from app import constants
+
+SCENARIOS = {
+    'stop': 'остановка лидера (SIGINT, аренда освобождается)',
+    'kill': 'аварийное завершение лидера (SIGKILL)',
+    'pause': 'приостановка лидера дольше срока аренды (SIGSTOP/SIGCONT)',
+}
+
+
+def run_replica(tick: float):
+    """
+    Реплика для проверки: продлевает аренду лидерства как бот и на каждом шаге
+    печатает метку времени, если считает себя лидером.
+    :param tick: Интервал шагов в секундах
+    """
+    import atexit
+    from app.config import db, replica_id
+    from app.leader import lease_heartbeat, release_leadership, holds_leadership
+    from app.orm_models.models import LeaderLease
+
+    db.create_tables([LeaderLease])
+    Thread(target=lease_heartbeat, daemon=True).start()
+    atexit.register(release_leadership)
+    try:
+        while True:
+            if holds_leadership():
+                print(f'{time():.3f} {replica_id}', flush=True)
+            sleep(tick)
+    except KeyboardInterrupt:
+        pass
+
+
+def start_replicas(count: int, db_path: str, tick: float,
+                   ticks: list[tuple[float, str]]) -> dict[str, subprocess.Popen]:
+    """
+    Запускает реплики отдельными процессами с общим файлом БД.
+    :param count: Количество реплик
+    :param db_path: Путь к файлу БД
+    :param tick: Интервал шагов реплик
+    :param ticks: Список, в который собираются метки лидерства (время, реплика)
+    :return: Процессы по идентификатору реплики
+    """
+    def collect(process: subprocess.Popen):
+        for line in process.stdout:
+            moment, replica = line.split()
+            ticks.append((float(moment), replica))
+
+    processes = {}
+    for index in range(count):
+        replica = f'replica-{index}'
+        env = dict(os.environ, DB_PATH=db_path, REPLICA_ID=replica)
+        process = subprocess.Popen([sys.executable, '-m', 'app.lease_check', '--replica', '--tick', str(tick)],
+                                   env=env, stdout=subprocess.PIPE, text=True)
+        Thread(target=collect, args=(process,), daemon=True).start()
+        processes[replica] = process
+    return processes
+
+
+def current_leader(ticks: list[tuple[float, str]], since: float) -> str | None:
+    """
+    Возвращает реплику, последней отметившуюся лидером после указанного момента.
+    :param ticks: Метки лидерства (время, реплика)
+    :param since: Момент времени
+    :return: Идентификатор реплики либо None
+    """
+    recent = [replica for moment, replica in ticks if moment >= since]
+    return recent[-1] if recent else None
+
+
+def check_scenario(scenario: str, replicas: int, tick: float) -> tuple[float, int]:
+    """
+    Запускает реплики, дожидается лидера, нарушает его работу согласно сценарию и
+    измеряет время перехода лидерства и количество пересечений лидерства.
+    :return: Время перехода лидерства в секундах и количество шагов, когда лидеров было несколько
+    """
+    ticks: list[tuple[float, str]] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processes = start_replicas(replicas, os.path.join(tmp_dir, 'lease.db'), tick, ticks)
+        try:
+            while not (leader := current_leader(ticks, 0)):
+                sleep(tick)
+            sleep(1)
+            process = processes[leader]
+            disrupted_at = time()
+            if scenario == 'stop':
+                process.send_signal(signal.SIGINT)
+            elif scenario == 'kill':
+                process.kill()
+            else:
+                process.send_signal(signal.SIGSTOP)
+            while not (successor := current_leader([t for t in ticks if t[1] != leader], disrupted_at)):
+                sleep(tick)
+            if scenario == 'pause':
+                sleep(constants.SCHEDULER_LEASE_SECONDS)
+                process.send_signal(signal.SIGCONT)
+            sleep(constants.SCHEDULER_LEASE_SECONDS)
+        finally:
+            for process in processes.values():
+                process.kill()
+                process.wait()
+
+    takeover = min(moment for moment, replica in ticks if replica == successor and moment >= disrupted_at) \
+        - disrupted_at
+    overlaps = 0
+    last_seen: dict[str, float] = {}
+    for moment, replica in sorted(ticks):
+        last_seen[replica] = moment
+        if any(other != replica and moment - seen < tick * 1.5 for other, seen in last_seen.items()):
+            overlaps += 1
+    return takeover, overlaps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проверка выбора лидера между репликами, запущенными '
+                                                 'отдельными процессами с общим файлом БД')
+    parser.add_argument('--replicas', type=int, default=3)
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append',
+                        help='сценарий проверки (по умолчанию - все)')
+    parser.add_argument('--tick', type=float, default=0.1, help='интервал проверки лидерства репликой')
+    parser.add_argument('--replica', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.replica:
+        logging.basicConfig(level=logging.ERROR, format='%(asctime)s %(levelname)s:%(message)s')
+        run_replica(args.tick)
+        sys.exit()
+
+    failed = False
+    for name in args.scenario or list(SCENARIOS):
+        takeover, overlaps = check_scenario(name, args.replicas, args.tick)
+        failed = failed or overlaps > 0
+        print(f'{SCENARIOS[name]}: переход лидерства за {takeover:.2f} с, '
+              f'шагов с несколькими лидерами: {overlaps}')
+    sys.exit(1 if failed else 0)
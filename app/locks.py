@@ -0,0 +1,126 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from threading import RLock, Lock
+from time import monotonic
+from typing import Callable, Iterable
+
+from app import constants
+from app.config import db
+
+
+class StripedLock:
+    """
+    Набор блокировок, распределённых по чатам по остатку от деления chat_id.
+    Операции одного чата выполняются последовательно, разные чаты (в разных
+    полосах) - параллельно. Блокировки реентерабельные, поэтому вложенные
+    вызовы в одном потоке (например, /endpoll -> завершение голосования) не
+    блокируют друг друга.
+    """
+    def __init__(self, stripes: int):
+        self.locks = [RLock() for _ in range(stripes)]
+        self.stats_lock = Lock()
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stripes_of(self, chat_ids: Iterable[int]) -> list[int]:
+        """
+        Возвращает номера полос для чатов в порядке возрастания (единый порядок
+        захвата исключает взаимные блокировки).
+        :param chat_ids: Идентификаторы чатов
+        :return: Номера полос без повторов
+        """
+        return sorted({chat_id % len(self.locks) for chat_id in chat_ids})
+
+    @contextmanager
+    def hold(self, *chat_ids: int):
+        """
+        Захватывает блокировки чатов на время выполнения блока и учитывает время ожидания.
+        :param chat_ids: Идентификаторы чатов
+        """
+        stripes = self.stripes_of(chat_ids)
+        started_at = monotonic()
+        for stripe in stripes:
+            self.locks[stripe].acquire()
+        self.record_wait(chat_ids, monotonic() - started_at)
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self.locks[stripe].release()
+
+    def record_wait(self, chat_ids: tuple[int, ...], wait: float):
+        """
+        Учитывает время ожидания блокировки. Долгие ожидания пишутся в лог.
+        :param chat_ids: Идентификаторы чатов
+        :param wait: Время ожидания в секундах
+        """
+        with self.stats_lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        if wait >= constants.CHAT_LOCK_WAIT_WARNING_SECONDS:
+            chat_id = chat_ids[0] if len(chat_ids) == 1 else None
+            logging.warning('Waited %.3f s for lock of %s chat(s)', wait, len(chat_ids), extra={'chat_id': chat_id})
+
+    def stats(self, reset: bool = False) -> tuple[int, float, float]:
+        """
+        Возвращает статистику ожидания блокировок.
+        :param reset: Обнулить статистику (чтобы следующий вызов вернул её за новый период)
+        :return: Количество захватов, среднее и максимальное время ожидания в секундах
+        """
+        with self.stats_lock:
+            result = (self.acquisitions,
+                      self.total_wait / self.acquisitions if self.acquisitions else 0.0,
+                      self.max_wait)
+            if reset:
+                self.acquisitions, self.total_wait, self.max_wait = 0, 0.0, 0.0
+            return result
+
+
+chat_locks = StripedLock(constants.CHAT_LOCK_STRIPES)
+
+
+def log_lock_stats():
+    """
+    Пишет в лог статистику ожидания блокировок чатов с прошлой записи и обнуляет её.
+    """
+    acquisitions, average, max_wait = chat_locks.stats(reset=True)
+    logging.info('Chat locks: %s acquisitions, mean wait %.1f ms, max wait %.1f ms',
+                 acquisitions, average * 1000, max_wait * 1000)
+
+
+def chat_locked(get_chat_id: Callable):
+    """
+    Декоратор хэндлера: выполняет хэндлер под блокировкой чата.
+    :param get_chat_id: Функция получения идентификатора чата из аргумента хэндлера
+    :return: Декоратор
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(update):
+            chat_id = get_chat_id(update)
+            if chat_id is None:
+                return handler(update)
+            with chat_locks.hold(chat_id):
+                return handler(update)
+        return wrapper
+    return decorator
+
+
+# пишущие транзакции процесса выполняются по очереди: потоки ждут на этой блокировке, а не в
+# обработчике занятости SQLite, который опрашивает блокировку БД с паузами до 100 мс
+db_write_lock = RLock()
+
+
+@contextmanager
+def write_transaction():
+    """
+    Транзакция, которая пишет после чтения. Начинается с BEGIN IMMEDIATE: в режиме WAL
+    запись в отложенной транзакции, снимок которой устарел из-за записи другого потока,
+    сразу завершается ошибкой "database is locked". Захватывать после блокировок чатов.
+    :return: Транзакция
+    """
+    with db_write_lock, db.atomic('IMMEDIATE') as transaction:
+        yield transaction
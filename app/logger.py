@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import date, datetime, timezone
+from itertools import count
+
+from app import constants
+
+# поля, которые переносятся из extra записи лога в структурированный вывод
+STRUCTURED_FIELDS = ('chat_id', 'poll_id', 'event')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s:%(message)s'
+
+# неизменяемые типы аргументов, подстановку которых можно отложить до потока QueueListener
+LAZY_ARG_TYPES = (str, int, float, type(None), date)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога в одну строку JSON. Поля chat_id, poll_id и event
+    переносятся из extra, если они были переданы при логировании.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только каждую N-ю запись для частых событий. Частота задаётся
+    словарём вида {название события: N}, событие берётся из extra={'event': ...}.
+    Записи уровня WARNING и выше пропускаются всегда.
+    """
+    def __init__(self, rates: dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.counters = {event: count() for event in rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if event not in self.rates or record.levelno >= logging.WARNING:
+            return True
+        return next(self.counters[event]) % self.rates[event] == 0
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который кладёт запись в очередь без предварительного форматирования,
+    если все аргументы сообщения неизменяемые (строки, числа, даты): подстановка таких
+    аргументов выполняется уже в потоке QueueListener. Сообщения с другими аргументами
+    (модели, списки, словари) форматируются сразу в потоке вызова: к моменту записи
+    объект мог измениться, а у моделей обращение к полям может выполнить запрос к БД
+    из потока логирования.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args.values() if isinstance(record.args, dict) else record.args or ()
+        if not all(isinstance(arg, LAZY_ARG_TYPES) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(level: int, json_format: bool = False, use_queue: bool = True):
+    """
+    Настраивает корневой логгер. При use_queue=True записи складываются в очередь
+    через QueueHandler, а форматирование и запись в stdout выполняются в отдельном
+    потоке QueueListener, чтобы логирование не задерживало хэндлеры и транзакции.
+    :param level: Уровень логирования
+    :param json_format: Выводить записи в виде JSON
+    :param use_queue: Писать логи через фоновый поток
+    :return: Запущенный QueueListener либо None
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    sampling_filter = SamplingFilter(constants.LOG_SAMPLING_RATES)
+
+    if not use_queue:
+        stream_handler.addFilter(sampling_filter)
+        root.addHandler(stream_handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    # фильтр на стороне продюсера, чтобы отброшенные записи не попадали в очередь
+    queue_handler.addFilter(sampling_filter)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,6 +1,9 @@
+import atexit
 import logging
 import os
 import sys
+from datetime import timedelta
+from threading import Thread
 
 import telebot
 
@@ -13,8 +16,18 @@ sys.path.append(parent_dir)
 sys.path.append(main_folder_path)
 
 # if move up then docker container won't start, DO NOT MOVE UP
-from app.config import db
-from app.orm_models.models import Member, ChatConfig, TenderParticipant
+from app import constants
+from app.backup import backup_loop
+from app.active_polls import active_polls
+from app.config import db, log_format, log_async, scheduler, backup_interval_hours, run_polling_enabled, \
+    bot_token
+from app.leader import lease_heartbeat, release_leadership, leader_only
+from app.logger import setup_logging
+from app.orm_models.models import Member, ChatConfig, TenderParticipant, PollHistory, MemberStats, PollClose, \
+    LeaderLease, BotState
+from app.orm_models.repo import ConfigRepo
+from app.updates import run_polling
+from app.utils import scheduler_loop, prune_history
 from bot import bot
 
 
@@ -29,18 +42,37 @@ if debugger_is_active():
     logging_level = logging.DEBUG
 
 if __name__ == '__main__':
-    logging.basicConfig(level=logging_level, format='%(asctime)s %(levelname)s:%(message)s')
-    db.create_tables([Member, ChatConfig, TenderParticipant])
+    if not bot_token:
+        sys.exit('BOT_TOKEN environment variable is not set')
+    setup_logging(logging_level, json_format=log_format == 'json', use_queue=log_async)
+    db.create_tables([Member, ChatConfig, TenderParticipant, PollHistory, MemberStats, PollClose, LeaderLease,
+                      BotState])
+    with db.atomic():
+        active_polls.load(ConfigRepo.get_active_polls())
     bot.set_my_commands([
         telebot.types.BotCommand("/start", "Запуск и инициализация бота для текущего чата"),
         telebot.types.BotCommand("/add", "Добавление пользователей"),
+        telebot.types.BotCommand("/export", "Выгрузка пользователей в CSV"),
         telebot.types.BotCommand("/delete", "Удаление пользователей"),
         telebot.types.BotCommand("/free", "Освободить от участия в тендере до указанной даты"),
         telebot.types.BotCommand("/info", "Список участников тендера"),
+        telebot.types.BotCommand("/stats", "Статистика участников по завершённым тендерам"),
         telebot.types.BotCommand("/poll", "Создание тендера на проведение дейли"),
         telebot.types.BotCommand("/repoll", "Замена одного участника текущего опроса"),
         telebot.types.BotCommand("/endpoll", "Завершение опроса")
     ])
 
-    # Start the bot
-    bot.polling(non_stop=True, interval=0)
+    # периодические задачи выполняет только реплика-лидер (см. scheduler_loop)
+    scheduler.cyclic(timedelta(seconds=constants.HISTORY_RETENTION_INTERVAL_SECONDS), leader_only(prune_history))
+    Thread(target=lease_heartbeat, daemon=True).start()
+    if backup_interval_hours > 0:
+        Thread(target=backup_loop, args=(timedelta(hours=backup_interval_hours),), daemon=True).start()
+    atexit.register(release_leadership)
+
+    if run_polling_enabled:
+        Thread(target=scheduler_loop, daemon=True).start()
+        # Start the bot
+        run_polling()
+    else:
+        logging.info('Polling of updates is disabled on this replica (RUN_POLLING=0)')
+        scheduler_loop()
@@ -1,5 +1,6 @@
 from datetime import date
 from peewee import *
+from app import clock
 from app.config import db
 
 
@@ -16,6 +17,10 @@ class Member(Model):
     class Meta:
         database = db
         table_name = 'members'
+        indexes = (
+            (('chat_id', 'full_name'), True),
+            (('chat_id', 'id'), False),
+        )
 
     def get_status_emoji(self):
         """
@@ -23,9 +28,7 @@ class Member(Model):
         для голосования.
         :return: Строка со статусом в виде эмодзи
         """
-        if self.__is_not_available():
-            return '⏱'
-        return '✅'
+        return Member.status_emoji(self.can_participate, self.skip_until_date)
 
     def availability_info(self):
         """
@@ -33,20 +36,45 @@ class Member(Model):
         текущей итерации, а также дату с которой он будет учавствовать в дейли
         :return: Строка со статусом в виде эмодзи
         """
-        if not self.can_participate:
+        return Member.availability_text(self.can_participate, self.skip_until_date)
+
+    @staticmethod
+    def status_emoji(can_participate: bool, skip_until_date: date | None):
+        """
+        Возвращает эмодзи-статус доступности по значениям полей пользователя
+        (для строк, выбранных без создания объектов модели).
+        :param can_participate: Возможность участвовать в дейли
+        :param skip_until_date: Дата, до которой пропускается участие в дейли
+        :return: Строка со статусом в виде эмодзи
+        """
+        if Member.is_not_available(can_participate, skip_until_date):
+            return '⏱'
+        return '✅'
+
+    @staticmethod
+    def availability_text(can_participate: bool, skip_until_date: date | None):
+        """
+        Возвращает информацию о доступности по значениям полей пользователя
+        (для строк, выбранных без создания объектов модели).
+        :param can_participate: Возможность участвовать в дейли
+        :param skip_until_date: Дата, до которой пропускается участие в дейли
+        :return: Строка с информацией о доступности
+        """
+        if not can_participate:
             return ', уже провёл дейли'
-        if self.__is_not_available() and self.skip_until_date is not None:
-            return self.skip_until_date.strftime(", доступен с %d.%m.%Y")
+        if Member.is_not_available(can_participate, skip_until_date) and skip_until_date is not None:
+            return skip_until_date.strftime(", доступен с %d.%m.%Y")
 
         return ''
 
-    def __is_not_available(self):
+    @staticmethod
+    def is_not_available(can_participate: bool, skip_until_date: date | None):
         """
-        Возвращает True, если участник доступен для участия в розыгрыше
+        Возвращает True, если участник недоступен для участия в розыгрыше
         тендера на дейли
-        :return: True - участник доступен, иначе - False
+        :return: True - участник недоступен, иначе - False
         """
-        return self.skip_until_date and self.skip_until_date > date.today() or not self.can_participate
+        return skip_until_date and skip_until_date > clock.today() or not can_participate
 
     @staticmethod
     def identity_query(identity: str):
@@ -58,7 +86,7 @@ class Member(Model):
         Возвращает запрос в бд о возможности участия в дейли.
         :return: Запросо о возможности участия в дейли
         """
-        return (Member.skip_until_date < date.today()) | (Member.skip_until_date.is_null() & Member.can_participate)
+        return (Member.skip_until_date < clock.today()) | (Member.skip_until_date.is_null() & Member.can_participate)
 
 
 class ChatConfig(Model):
@@ -67,11 +95,11 @@ class ChatConfig(Model):
     """
     chat_id = IntegerField(unique=True)
     last_daily_date = DateField(null=True)
-    last_poll_id = TextField(null=True)
+    last_poll_id = TextField(null=True, index=True)
     last_poll_message_id = IntegerField(null=True)
 
     def is_poll_not_relevant(self):
-        return self.last_daily_date is None or self.last_daily_date != date.today()
+        return self.last_daily_date is None or self.last_daily_date != clock.today()
 
     class Meta:
         database = db
@@ -90,3 +118,78 @@ class TenderParticipant(Model):
     class Meta:
         database = db
         table_name = 'tender_participants'
+
+
+class PollHistory(Model):
+    """
+    Запись архива завершённых голосований (только добавление). Имя участника
+    хранится копией, чтобы история не зависела от удаления пользователей.
+    """
+    poll_id = TextField(null=True, index=True)
+    chat_id = IntegerField()
+    member_id = IntegerField()
+    full_name = TextField()
+    vote_count = IntegerField(default=0)
+    is_winner = BooleanField(default=False)
+    closed_date = DateField(index=True)
+
+    class Meta:
+        database = db
+        table_name = 'poll_history'
+
+
+class MemberStats(Model):
+    """
+    Накопительная статистика участника чата по завершённым голосованиям
+    """
+    chat_id = IntegerField()
+    member = ForeignKeyField(Member)
+    times_nominated = IntegerField(default=0)
+    times_won = IntegerField(default=0)
+    total_votes = IntegerField(default=0)
+
+    class Meta:
+        database = db
+        table_name = 'member_stats'
+        indexes = (
+            (('chat_id', 'member'), True),
+        )
+
+
+class PollClose(Model):
+    """
+    Запланированное завершение голосования чата. Хранится в БД, чтобы голосование,
+    созданное на любой реплике, завершила реплика-лидер.
+    """
+    chat_id = IntegerField(unique=True)
+    close_at = DateTimeField(index=True)
+
+    class Meta:
+        database = db
+        table_name = 'poll_closes'
+
+
+class LeaderLease(Model):
+    """
+    Аренда лидерства между репликами бота. Лидер периодически продлевает аренду,
+    после истечения expires_at лидерство может захватить другая реплика.
+    """
+    name = TextField(unique=True)
+    holder = TextField()
+    expires_at = DateTimeField()
+
+    class Meta:
+        database = db
+        table_name = 'leader_leases'
+
+
+class BotState(Model):
+    """
+    Служебные значения бота (например, идентификатор последнего обработанного обновления)
+    """
+    name = TextField(unique=True)
+    value = TextField()
+
+    class Meta:
+        database = db
+        table_name = 'bot_state'
@@ -1,9 +1,22 @@
 import logging
 import random
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterable
+
+from app import clock, constants
 
 from .models import *
 
 
+def utc_now() -> datetime:
+    """
+    Возвращает текущее время по UTC без информации о часовом поясе (в таком виде время хранится в БД).
+    :return: Текущее время
+    """
+    return clock.now().astimezone(timezone.utc).replace(tzinfo=None)
+
+
 class TenderParticipantRepo:
     """
     Репозиторий участников текущего голосования
@@ -15,12 +28,10 @@ class TenderParticipantRepo:
         :param poll_id: Идентификатор голосования
         :param members: Пользователи, участвующие в голосовании
         """
-        logging.info("Adding tender participant for vote (poll_id={0}".format(poll_id))
-        for m in members:
-            tender_participant = TenderParticipant(poll_id=poll_id, member=m.id, chat_id=m.chat_id)
-            tender_participant.save()
-            logging.info('Tender participant "{0}" (poll_id={1}) successfully added'.format(
-                m.full_name, poll_id))
+        logging.info("Adding tender participants for vote (poll_id=%s)", poll_id, extra={'poll_id': poll_id})
+        TenderParticipant.insert_many(
+            [{'poll_id': poll_id, 'member': m.id, 'chat_id': m.chat_id} for m in members]
+        ).execute()
 
     @staticmethod
     def get_participants_by_poll_id(poll_id: str):
@@ -29,12 +40,13 @@ class TenderParticipantRepo:
         :param poll_id: Идентификатор голосования
         :return: Список участников текущего тендера
         """
-        logging.info(f"Retrieving tender participants...")
+        logging.info("Retrieving tender participants (poll_id=%s)...", poll_id, extra={'poll_id': poll_id})
         result = TenderParticipant.select().where(TenderParticipant.poll_id == poll_id)
         if len(result) == 0:
-            logging.error("Cannot get tender participants: no tender participants in db (poll id={0})".format(poll_id))
+            logging.error("Cannot get tender participants: no tender participants in db (poll id=%s)", poll_id,
+                          extra={'poll_id': poll_id})
             raise DatabaseError("Не найдено участников тендера в базе данных")
-        logging.info(f"Retrieved members count: {len(result)}")
+        logging.info("Retrieved members count: %s", len(result), extra={'poll_id': poll_id})
         return result
 
     @staticmethod
@@ -46,35 +58,37 @@ class TenderParticipantRepo:
         :param vote_count: Количество голосов
         """
         name = member.full_name
-        logging.info("Updating vote count for participant {0} (poll_id={1})".format(name, poll_id))
-        poll: TenderParticipant = TenderParticipant.get_or_none(poll_id=poll_id, member_id=member.id)
-        if not poll:
-            logging.error("Cannot retrieve poll by poll_id={}".format(poll_id))
+        logging.info("Updating vote count for participant %s (poll_id=%s)", name, poll_id,
+                     extra={'chat_id': member.chat_id, 'poll_id': poll_id, 'event': 'vote_update'})
+        updated = (TenderParticipant
+                   .update(vote_count=vote_count)
+                   .where((TenderParticipant.poll_id == poll_id) & (TenderParticipant.member == member.id))
+                   .execute())
+        if not updated:
+            logging.error("Cannot retrieve poll by poll_id=%s", poll_id,
+                          extra={'chat_id': member.chat_id, 'poll_id': poll_id})
             raise DatabaseError("Не удаётся получить голосование с id={}".format(poll_id))
-        poll.vote_count = vote_count
-        poll.save()
-        logging.info("Vote count for participant {0} (poll_id={1}) updated successfully".format(name, poll_id))
+        logging.info("Vote count for participant %s (poll_id=%s) updated successfully", name, poll_id,
+                     extra={'chat_id': member.chat_id, 'poll_id': poll_id, 'event': 'vote_update'})
 
     @staticmethod
-    def get_most_voted_participant(poll_id: str):
+    def get_most_voted_participants(poll_ids: list[str]) -> dict[str, TenderParticipant]:
         """
-        Возвращает участника с наибольшим количеством голосов.
-        :param poll_id: Идентификатор голосования
-        :return: Участник с наибольшим количеством голосов
+        Возвращает участников с наибольшим количеством голосов для нескольких голосований
+        одним запросом.
+        :param poll_ids: Идентификаторы голосований
+        :return: Победители по идентификатору голосования
         """
-        logging.info("Retrieving the most voted participant on poll with id={}".format(poll_id))
-        winner: TenderParticipant = (
+        winners = (
             TenderParticipant
-            .select(TenderParticipant.member, fn.MAX(TenderParticipant.vote_count))
-            .where(TenderParticipant.poll_id == poll_id)
-            .get_or_none()
+            .select(TenderParticipant, Member, fn.MAX(TenderParticipant.vote_count))
+            .join(Member)
+            .where(TenderParticipant.poll_id.in_(poll_ids))
+            .group_by(TenderParticipant.poll_id)
         )
-        if not winner:
-            logging.error("Cannot retrieve most voted participant of daily tender poll (poll_id={})".format(poll_id))
-            raise DatabaseError("Не удалось получить победителя тендера на дейли из базы данных (poll_id={})"
-                                .format(poll_id))
-        logging.info("Most voted participant on poll with id={} successfully retrieved".format(poll_id))
-        return winner
+        result = {winner.poll_id: winner for winner in winners}
+        logging.info("Retrieved winners of %s polls out of %s", len(result), len(poll_ids))
+        return result
 
     @staticmethod
     def delete_participants(chat_id: int):
@@ -82,10 +96,11 @@ class TenderParticipantRepo:
         Удаляет участников голосования определенного чата.
         :param chat_id: Идентификатор чата
         """
-        logging.info("Deleting participants of closed poll (chat_id={0})".format(chat_id))
+        logging.info("Deleting participants of closed poll (chat_id=%s)", chat_id, extra={'chat_id': chat_id})
         query = TenderParticipant.delete().where(TenderParticipant.chat_id == chat_id)
         result_count = query.execute()
-        logging.info("Successfully deleted (chat_id={0}, records={1})".format(chat_id, result_count))
+        logging.info("Successfully deleted (chat_id=%s, records=%s)", chat_id, result_count,
+                     extra={'chat_id': chat_id})
 
 
 class ConfigRepo:
@@ -100,8 +115,8 @@ class ConfigRepo:
         :return: True - если можно организовать тендер, False - в ином случае
         """
         config = ChatConfig.get_or_none(ChatConfig.chat_id == chat_id)
-        logging.info("Configuration of chat #{0} is successfully retrieved".format(chat_id))
-        return config.last_daily_date is None or config.last_daily_date < date.today()
+        logging.info("Configuration of chat #%s is successfully retrieved", chat_id, extra={'chat_id': chat_id})
+        return config.last_daily_date is None or config.last_daily_date < clock.today()
 
     @staticmethod
     def add_config(chat_id: int):
@@ -111,7 +126,7 @@ class ConfigRepo:
         """
         config = ChatConfig(chat_id=chat_id)
         res = config.save()
-        logging.info("Configuration of chat #{0} is saved ({1})".format(chat_id, res))
+        logging.info("Configuration of chat #%s is saved (%s)", chat_id, res, extra={'chat_id': chat_id})
         return True
 
     @staticmethod
@@ -126,10 +141,10 @@ class ConfigRepo:
         :param last_poll_id: Идентификатор последнего голосования
         :param last_poll_message_id: Идентификатор сообщения с последним голосованием
         """
-        logging.info("Updating configuration of chat with id={}".format(chat_id))
+        logging.info("Updating configuration of chat with id=%s", chat_id, extra={'chat_id': chat_id})
         config: ChatConfig = ChatConfig.get_or_none(chat_id=chat_id)
         if not config:
-            logging.error("Cannot retrieve config of chat with id={}".format(chat_id))
+            logging.error("Cannot retrieve config of chat with id=%s", chat_id, extra={'chat_id': chat_id})
             raise DatabaseError('Не удалось получить конфигурацию чата с id={}'.format(chat_id))
         if last_daily_date:
             config.last_daily_date = last_daily_date
@@ -138,7 +153,41 @@ class ConfigRepo:
         if last_poll_message_id:
             config.last_poll_message_id = last_poll_message_id
         res = config.save()
-        logging.info("Configuration of chat #{0} is updated ({1})".format(chat_id, res))
+        logging.info("Configuration of chat #%s is updated (%s)", chat_id, res, extra={'chat_id': chat_id})
+
+    @staticmethod
+    def get_configs(chat_ids: list[int]) -> list[ChatConfig]:
+        """
+        Возвращает конфигурации нескольких чатов одним запросом.
+        :param chat_ids: Идентификаторы чатов
+        :return: Список конфигураций
+        """
+        return list(ChatConfig.select().where(ChatConfig.chat_id.in_(chat_ids)))
+
+    @staticmethod
+    def get_active_polls() -> dict[str, int]:
+        """
+        Возвращает голосования, завершение которых ещё запланировано.
+        :return: Идентификаторы чатов по идентификатору незавершённого голосования
+        """
+        query = (ChatConfig
+                 .select(ChatConfig.last_poll_id, ChatConfig.chat_id)
+                 .join(PollClose, on=(PollClose.chat_id == ChatConfig.chat_id))
+                 .where(ChatConfig.last_poll_id.is_null(False)))
+        return dict(query.tuples())
+
+    @staticmethod
+    def get_active_poll_chat_id(poll_id: str) -> int | None:
+        """
+        Возвращает чат голосования, если его завершение ещё запланировано.
+        :param poll_id: Идентификатор голосования
+        :return: Идентификатор чата либо None
+        """
+        return (ChatConfig
+                .select(ChatConfig.chat_id)
+                .join(PollClose, on=(PollClose.chat_id == ChatConfig.chat_id))
+                .where(ChatConfig.last_poll_id == poll_id)
+                .scalar())
 
     @staticmethod
     def get_config(chat_id: int):
@@ -149,7 +198,7 @@ class ConfigRepo:
         """
         config = ChatConfig.get_or_none(ChatConfig.chat_id == chat_id)
         if not config:
-            logging.error('Cannot find config of chat with id "{}"'.format(chat_id))
+            logging.error('Cannot find config of chat with id "%s"', chat_id, extra={'chat_id': chat_id})
             raise DatabaseError('Не удалось найти конфигурацию чата с id "{}"'.format(chat_id))
         return config
 
@@ -168,11 +217,28 @@ class MemberRepo:
         """
         participant, created = Member.get_or_create(full_name=full_name, chat_id=chat_id)
         if not created:
-            logging.warning(
-                'User with name "{0}" of chat with id={1} is already in database'.format(full_name, chat_id))
+            logging.warning('User with name "%s" of chat with id=%s is already in database', full_name, chat_id,
+                            extra={'chat_id': chat_id})
             raise DatabaseError('Пользователь "{}" уже есть в базе данных'.format(full_name))
-        res = participant.save()
-        logging.info('Added new user with name "{0}" ({1})'.format(chat_id, res))
+        logging.info('Added new user with name "%s" (id=%s)', full_name, participant.id, extra={'chat_id': chat_id})
+
+    @staticmethod
+    def add_members(chat_id: int, rows: Iterable[dict]) -> tuple[int, int]:
+        """
+        Добавляет пользователей пачками через insert_many. Пользователи, которые уже
+        есть в чате, пропускаются (on conflict ignore).
+        :param chat_id: Идентификатор чата
+        :param rows: Поля пользователей (full_name и, опционально, can_participate, skip_until_date)
+        :return: Количество обработанных строк и количество добавленных пользователей
+        """
+        rows = iter(rows)
+        total, added = 0, 0
+        while batch := [dict(row, chat_id=chat_id) for row in islice(rows, constants.INSERT_BATCH_SIZE)]:
+            total += len(batch)
+            added += Member.insert_many(batch).on_conflict_ignore().as_rowcount().execute()
+        logging.info("Bulk import of members (chat_id=%s): %s rows, %s added", chat_id, total, added,
+                     extra={'chat_id': chat_id})
+        return total, added
 
     @staticmethod
     def update_member(chat_id: int,
@@ -186,16 +252,31 @@ class MemberRepo:
         :param can_participate: Возможность участвовать в дейли
         :param skip_until_date: Дата, до которой пропускается участие в дейли
         """
-        logging.info('Updating member with name "{}" of chat with id={}'.format(full_name, chat_id))
+        logging.info('Updating member with name "%s" of chat with id=%s', full_name, chat_id,
+                     extra={'chat_id': chat_id})
         member: Member = Member.get_or_none(chat_id=chat_id, full_name=full_name)
         if not member:
-            logging.error('Cannot retrieve member with name "{}" from chat with id={}'.format(full_name, chat_id))
+            logging.error('Cannot retrieve member with name "%s" from chat with id=%s', full_name, chat_id,
+                          extra={'chat_id': chat_id})
             raise DatabaseError('Не удалось получить участника по имени "{}" чата с id={}'.format(full_name, chat_id))
         if can_participate is not None:
             member.can_participate = can_participate
         member.skip_until_date = skip_until_date
         res = member.save()
-        logging.info('Member with name "{}" of chat #{} is updated ({})'.format(full_name, chat_id, res))
+        logging.info('Member with name "%s" of chat #%s is updated (%s)', full_name, chat_id, res,
+                     extra={'chat_id': chat_id})
+
+    @staticmethod
+    def mark_winners(member_ids: list[int]):
+        """
+        Отмечает победителей голосований как уже проводивших дейли одним запросом.
+        :param member_ids: Идентификаторы пользователей
+        """
+        res = (Member
+               .update(can_participate=False, skip_until_date=None)
+               .where(Member.id.in_(member_ids))
+               .execute())
+        logging.info("Marked %s winners as already organised daily", res)
 
     @staticmethod
     def reset_members_participation_statuses(chat_id: int):
@@ -203,11 +284,11 @@ class MemberRepo:
         Сбрасывает статус всех участников к дефолтному состоянию "готов к проведению дейли"
         :param chat_id: Идентификатор чата
         """
-        logging.info("Resetting member participation status of chat with id={}".format(chat_id))
+        logging.info("Resetting member participation status of chat with id=%s", chat_id, extra={'chat_id': chat_id})
         query = Member.update(can_participate=True).where(Member.chat_id == chat_id)
         res = query.execute()
-        logging.info("Participation statuses of members of chat #{0} is updated (updated {1} rows)"
-                     .format(chat_id, res))
+        logging.info("Participation statuses of members of chat #%s is updated (updated %s rows)", chat_id, res,
+                     extra={'chat_id': chat_id})
 
     @staticmethod
     def delete_member(identity: str, chat_id: int):
@@ -219,26 +300,57 @@ class MemberRepo:
         identity_label = 'идентификатором' if identity.isdigit() else 'именем'
         participant = Member.get_or_none(Member.identity_query(identity), Member.chat_id == chat_id)
         if not participant:
-            logging.error('There is no user with identity "{0}" in database'.format(identity))
+            logging.error('There is no user with identity "%s" in database', identity, extra={'chat_id': chat_id})
             raise DatabaseError('Не удалось удалить пользователя с {} "{}" (нет в базе данных)'
                                 .format(identity_label, identity))
+        MemberStatsRepo.delete_member_stats(participant.id)
         participant.delete_instance()
-        logging.info('User with identity "{0}" deleted successfully'.format(identity))
+        logging.info('User with identity "%s" deleted successfully', identity, extra={'chat_id': chat_id})
 
     @staticmethod
-    def get_members_by_chat_id(chat_id: int):
+    def get_members_page(chat_id: int, after_id: int = None, before_id: int = None,
+                         limit: int = constants.INFO_PAGE_SIZE) -> tuple[list[tuple], bool]:
         """
-        Получает информацию о пользователях чата.
+        Возвращает страницу пользователей чата с keyset-пагинацией по (chat_id, id).
+        Строки выбираются кортежами без создания объектов модели.
         :param chat_id: Идентификатор чата
-        :return: Список пользователей чата
+        :param after_id: Вернуть пользователей с id больше указанного (следующая страница)
+        :param before_id: Вернуть пользователей с id меньше указанного (предыдущая страница)
+        :param limit: Размер страницы
+        :return: Кортежи (id, имя, возможность участия, дата пропуска) по возрастанию id и
+        признак наличия ещё одной страницы в направлении выборки
+        """
+        query = (Member
+                 .select(Member.id, Member.full_name, Member.can_participate, Member.skip_until_date)
+                 .where(Member.chat_id == chat_id))
+        if before_id is not None:
+            query = query.where(Member.id < before_id).order_by(Member.id.desc())
+        else:
+            query = query.where(Member.id > (after_id or 0)).order_by(Member.id)
+        rows = list(query.limit(limit + 1).tuples())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before_id is not None:
+            rows.reverse()
+        logging.info("Retrieved page of %s members (chat_id=%s)", len(rows), chat_id, extra={'chat_id': chat_id})
+        return rows, has_more
+
+    @staticmethod
+    def iter_members_for_export(chat_id: int):
         """
-        logging.info(f"Retrieving members...")
-        result = Member.select().where(Member.chat_id == chat_id)
-        if len(result) == 0:
-            logging.error("Cannot get members: no users in db (chat id={0})".format(chat_id))
-            raise DatabaseError("Не найдено участников тендера в базе данных")
-        logging.info(f"Retrieved members count: {len(result)}")
-        return result
+        Возвращает итератор по пользователям чата для выгрузки без загрузки
+        всего списка в память.
+        :param chat_id: Идентификатор чата
+        :return: Итератор кортежей (имя, возможность участия, дата пропуска)
+        """
+        return (
+            Member
+            .select(Member.full_name, Member.can_participate, Member.skip_until_date)
+            .where(Member.chat_id == chat_id)
+            .order_by(Member.id)
+            .tuples()
+            .iterator()
+        )
 
     @staticmethod
     def get_member_by_full_name(full_name: str):
@@ -249,7 +361,7 @@ class MemberRepo:
         """
         member = Member.get_or_none(Member.full_name == full_name)
         if not member:
-            logging.error('Cannot find member by name "{0}"'.format(full_name))
+            logging.error('Cannot find member by name "%s"', full_name)
             raise DatabaseError('Не удалось найти пользователя с именем "{0}"'.format(full_name))
         return member
 
@@ -262,7 +374,7 @@ class MemberRepo:
         :param exceptions: Имена пользователей, которых не должно быть в выдаче
         :return: Список случайно выбранных пользователей
         """
-        logging.info("Retrieving members for daily...")
+        logging.info("Retrieving members for daily (chat_id=%s)...", chat_id, extra={'chat_id': chat_id})
 
         if not exceptions:
             exceptions = []
@@ -277,10 +389,301 @@ class MemberRepo:
 
         if len(members) <= count:
             member_names = [m.full_name for m in members]
-            logging.info('Got less than {} candidates: {}'.format(count, ' '.join(member_names)))
+            logging.info('Got less than %s candidates: %s', count, ' '.join(member_names), extra={'chat_id': chat_id})
             return list(members)
 
         chosen_members: list[Member] = random.sample(list(members), count)
         chosen_member_names = [m.full_name for m in chosen_members]
-        logging.info('Successfully chosen members: {0}'.format(' '.join(chosen_member_names)))
+        logging.info('Successfully chosen members: %s', ' '.join(chosen_member_names), extra={'chat_id': chat_id})
         return chosen_members
+
+
+class PollHistoryRepo:
+    """
+    Репозиторий архива завершённых голосований
+    """
+    @staticmethod
+    def get_archived_poll_ids(poll_ids: list[str]) -> set[str]:
+        """
+        Возвращает идентификаторы голосований, которые уже есть в архиве.
+        :param poll_ids: Идентификаторы голосований
+        :return: Множество заархивированных голосований
+        """
+        query = PollHistory.select(PollHistory.poll_id).where(PollHistory.poll_id.in_(poll_ids)).distinct()
+        return {poll_id for poll_id, in query.tuples()}
+
+    @staticmethod
+    def archive_polls(winners: dict[str, TenderParticipant]):
+        """
+        Переносит участников завершённых голосований в архив и обновляет накопительную
+        статистику участников запросами INSERT ... SELECT, не загружая участников в приложение.
+        :param winners: Победители по идентификатору голосования
+        """
+        if not winners:
+            return
+        poll_ids = list(winners)
+        winner_ids = [winner.member.id for winner in winners.values()]
+        participants = (
+            TenderParticipant
+            .select(TenderParticipant.poll_id,
+                    TenderParticipant.chat_id,
+                    Member.id,
+                    Member.full_name,
+                    TenderParticipant.vote_count,
+                    Member.id.in_(winner_ids),
+                    Value(clock.today()))
+            .join(Member)
+            .where(TenderParticipant.poll_id.in_(poll_ids))
+        )
+        archived = (PollHistory
+                    .insert_from(participants, [PollHistory.poll_id,
+                                                PollHistory.chat_id,
+                                                PollHistory.member_id,
+                                                PollHistory.full_name,
+                                                PollHistory.vote_count,
+                                                PollHistory.is_winner,
+                                                PollHistory.closed_date])
+                    .as_rowcount()
+                    .execute())
+        MemberStatsRepo.increment_from_history(poll_ids)
+        logging.info("Archived %s polls with %s participants", len(winners), archived)
+
+    @staticmethod
+    def archive_single_win(chat_id: int, winner: Member):
+        """
+        Записывает в архив победу единственного доступного участника (без голосования).
+        :param chat_id: Идентификатор чата
+        :param winner: Победитель
+        """
+        PollHistory.create(poll_id=None,
+                           chat_id=chat_id,
+                           member_id=winner.id,
+                           full_name=winner.full_name,
+                           is_winner=True,
+                           closed_date=clock.today())
+        MemberStatsRepo.increment_many([{'chat_id': chat_id,
+                                         'member_id': winner.id,
+                                         'is_winner': True,
+                                         'vote_count': 0}])
+        logging.info('Single win of "%s" archived', winner.full_name, extra={'chat_id': chat_id})
+
+    @staticmethod
+    def prune_history(before_date: date) -> int:
+        """
+        Удаляет записи архива голосований, завершённых раньше указанной даты.
+        Накопительная статистика при этом не меняется.
+        :param before_date: Дата, раньше которой записи удаляются
+        :return: Количество удалённых записей
+        """
+        res = PollHistory.delete().where(PollHistory.closed_date < before_date).execute()
+        logging.info("Pruned poll history before %s (deleted %s rows)", before_date, res)
+        return res
+
+
+class MemberStatsRepo:
+    """
+    Репозиторий накопительной статистики участников
+    """
+    @staticmethod
+    def increment_many(rows: list[dict]):
+        """
+        Увеличивает счётчики участников пачками через upsert.
+        :param rows: Строки с полями chat_id, member_id, is_winner, vote_count
+        """
+        stats = [{'chat_id': row['chat_id'],
+                  'member': row['member_id'],
+                  'times_nominated': 1,
+                  'times_won': 1 if row['is_winner'] else 0,
+                  'total_votes': row['vote_count']} for row in rows]
+        for batch in chunked(stats, constants.INSERT_BATCH_SIZE):
+            (MemberStats
+             .insert_many(batch)
+             .on_conflict(conflict_target=[MemberStats.chat_id, MemberStats.member],
+                          update={MemberStats.times_nominated: MemberStats.times_nominated + 1,
+                                  MemberStats.times_won: MemberStats.times_won + EXCLUDED.times_won,
+                                  MemberStats.total_votes: MemberStats.total_votes + EXCLUDED.total_votes})
+             .execute())
+
+    @staticmethod
+    def increment_from_history(poll_ids: list[str]):
+        """
+        Увеличивает счётчики участников заархивированных голосований одним upsert из архива.
+        :param poll_ids: Идентификаторы заархивированных голосований
+        """
+        archived = (
+            PollHistory
+            .select(PollHistory.chat_id,
+                    PollHistory.member_id,
+                    Value(1),
+                    PollHistory.is_winner,
+                    PollHistory.vote_count)
+            .where(PollHistory.poll_id.in_(poll_ids))
+        )
+        (MemberStats
+         .insert_from(archived, [MemberStats.chat_id,
+                                 MemberStats.member,
+                                 MemberStats.times_nominated,
+                                 MemberStats.times_won,
+                                 MemberStats.total_votes])
+         .on_conflict(conflict_target=[MemberStats.chat_id, MemberStats.member],
+                      update={MemberStats.times_nominated: MemberStats.times_nominated + 1,
+                              MemberStats.times_won: MemberStats.times_won + EXCLUDED.times_won,
+                              MemberStats.total_votes: MemberStats.total_votes + EXCLUDED.total_votes})
+         .execute())
+
+    @staticmethod
+    def get_chat_stats(chat_id: int):
+        """
+        Возвращает статистику участников чата, отсортированную по количеству побед.
+        :param chat_id: Идентификатор чата
+        :return: Список кортежей (имя, номинации, победы, голоса)
+        """
+        result = list(
+            MemberStats
+            .select(Member.full_name, MemberStats.times_nominated, MemberStats.times_won, MemberStats.total_votes)
+            .join(Member)
+            .where(MemberStats.chat_id == chat_id)
+            .order_by(MemberStats.times_won.desc(), MemberStats.total_votes.desc())
+            .tuples()
+        )
+        if not result:
+            logging.error("Cannot get stats: no finished polls in db (chat id=%s)", chat_id, extra={'chat_id': chat_id})
+            raise DatabaseError("Нет статистики по завершённым голосованиям")
+        return result
+
+    @staticmethod
+    def delete_member_stats(member_id: int):
+        """
+        Удаляет статистику пользователя.
+        :param member_id: Идентификатор пользователя
+        """
+        MemberStats.delete().where(MemberStats.member == member_id).execute()
+
+
+class PollCloseRepo:
+    """
+    Репозиторий запланированных завершений голосований
+    """
+    @staticmethod
+    def schedule(chat_id: int, close_at: datetime):
+        """
+        Планирует завершение голосования чата, заменяя ранее запланированное.
+        :param chat_id: Идентификатор чата
+        :param close_at: Время завершения (UTC)
+        """
+        close_at = close_at.astimezone(timezone.utc).replace(tzinfo=None)
+        (PollClose
+         .insert(chat_id=chat_id, close_at=close_at)
+         .on_conflict(conflict_target=[PollClose.chat_id], update={PollClose.close_at: close_at})
+         .execute())
+        logging.info("Poll close of chat #%s scheduled at %s UTC", chat_id, close_at, extra={'chat_id': chat_id})
+
+    @staticmethod
+    def cancel(chat_id: int):
+        """
+        Отменяет запланированное завершение голосования чата.
+        :param chat_id: Идентификатор чата
+        """
+        res = PollClose.delete().where(PollClose.chat_id == chat_id).execute()
+        logging.info("Scheduled poll close of chat #%s cancelled (%s)", chat_id, res, extra={'chat_id': chat_id})
+
+    @staticmethod
+    def get_due(now: datetime) -> list[int]:
+        """
+        Возвращает чаты, время завершения голосований которых наступило.
+        :param now: Текущее время (UTC)
+        :return: Идентификаторы чатов
+        """
+        return [chat_id for chat_id, in
+                PollClose.select(PollClose.chat_id).where(PollClose.close_at <= now).tuples()]
+
+    @staticmethod
+    def pop_due(now: datetime, chat_ids: list[int]) -> list[int]:
+        """
+        Забирает завершения голосований указанных чатов, время которых наступило. Вызывать
+        в той же транзакции (с блокировкой на запись), что и завершение голосований: при
+        откате завершения остаются запланированными, а одно завершение не забирается дважды.
+        :param now: Текущее время (UTC)
+        :param chat_ids: Идентификаторы чатов
+        :return: Идентификаторы забранных чатов
+        """
+        due = (PollClose.chat_id.in_(chat_ids)) & (PollClose.close_at <= now)
+        claimed = [chat_id for chat_id, in PollClose.select(PollClose.chat_id).where(due).tuples()]
+        if claimed:
+            PollClose.delete().where(PollClose.chat_id.in_(claimed)).execute()
+        return claimed
+
+    @staticmethod
+    def postpone(chat_ids: list[int], close_at: datetime):
+        """
+        Переносит запланированные завершения голосований (для повтора после ошибки).
+        :param chat_ids: Идентификаторы чатов
+        :param close_at: Новое время завершения (UTC без часового пояса, как utc_now)
+        """
+        res = PollClose.update(close_at=close_at).where(PollClose.chat_id.in_(chat_ids)).execute()
+        logging.info("Poll closes of %s chats postponed to %s UTC", res, close_at)
+
+
+class LeaseRepo:
+    """
+    Репозиторий аренды лидерства между репликами
+    """
+    @staticmethod
+    def try_acquire(name: str, holder: str, ttl_seconds: int) -> bool:
+        """
+        Захватывает или продлевает аренду одним upsert-запросом. Аренда перехватывается
+        только если она принадлежит этой же реплике или уже истекла.
+        :param name: Название аренды
+        :param holder: Идентификатор реплики
+        :param ttl_seconds: Срок аренды в секундах
+        :return: True - реплика является лидером, иначе - False
+        """
+        now = utc_now()
+        (LeaderLease
+         .insert(name=name, holder=holder, expires_at=now + timedelta(seconds=ttl_seconds))
+         .on_conflict(conflict_target=[LeaderLease.name],
+                      update={LeaderLease.holder: EXCLUDED.holder, LeaderLease.expires_at: EXCLUDED.expires_at},
+                      where=(LeaderLease.holder == holder) | (LeaderLease.expires_at < now))
+         .execute())
+        return LeaderLease.get(LeaderLease.name == name).holder == holder
+
+    @staticmethod
+    def release(name: str, holder: str):
+        """
+        Освобождает аренду, если она принадлежит реплике, чтобы другая реплика
+        могла стать лидером без ожидания истечения срока.
+        :param name: Название аренды
+        :param holder: Идентификатор реплики
+        """
+        (LeaderLease
+         .update(expires_at=datetime.min)
+         .where((LeaderLease.name == name) & (LeaderLease.holder == holder))
+         .execute())
+
+
+class BotStateRepo:
+    """
+    Репозиторий служебных значений бота
+    """
+    @staticmethod
+    def get(name: str, default: str = None) -> str | None:
+        """
+        Возвращает служебное значение по названию.
+        :param name: Название значения
+        :param default: Значение по умолчанию
+        :return: Строковое значение
+        """
+        state = BotState.get_or_none(BotState.name == name)
+        return state.value if state else default
+
+    @staticmethod
+    def set(name: str, value: str):
+        """
+        Сохраняет служебное значение.
+        :param name: Название значения
+        :param value: Строковое значение
+        """
+        (BotState
+         .insert(name=name, value=value)
+         .on_conflict(conflict_target=[BotState.name], update={BotState.value: value})
+         .execute())
@@ -0,0 +1,75 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable
+
+from telebot.apihelper import ApiTelegramException
+
+from app import constants
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов (token bucket), общий для всех потоков пула отправки.
+    """
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        self.rate = rate_per_second
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        """
+        Блокирует поток, пока не появится возможность отправить очередной запрос.
+        """
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+limiter = RateLimiter(constants.SENDER_RATE_PER_SECOND, constants.SENDER_RATE_PER_SECOND)
+
+
+def call_with_retry(request: Callable, *args, **kwargs):
+    """
+    Выполняет запрос к Telegram с учётом ограничителя частоты. При ответе 429
+    ждёт указанное Telegram время (retry_after) и повторяет запрос.
+    :param request: Метод бота
+    :return: Результат запроса
+    """
+    for attempt in range(constants.SENDER_MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            return request(*args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code != 429 or attempt == constants.SENDER_MAX_RETRIES:
+                raise
+            retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+            logging.warning('Telegram rate limit hit, retrying after %s s', retry_after)
+            sleep(retry_after)
+
+
+def send_all(tasks: dict[int, Callable[[], None]]):
+    """
+    Параллельно выполняет задачи отправки сообщений в разные чаты. Запросы в один
+    чат выполняются последовательно внутри одной задачи. Ошибка в одном чате не
+    прерывает отправку в остальные.
+    :param tasks: Задачи отправки по идентификатору чата
+    """
+    if not tasks:
+        return
+    with ThreadPoolExecutor(max_workers=min(constants.SENDER_POOL_SIZE, len(tasks))) as executor:
+        futures = {chat_id: executor.submit(task) for chat_id, task in tasks.items()}
+    for chat_id, future in futures.items():
+        if future.exception():
+            logging.error('Cannot send messages to chat (id=%s): %s', chat_id, future.exception(),
+                          extra={'chat_id': chat_id})
@@ -0,0 +1,188 @@
+import argparse
+import logging
+import random
+from datetime import date, datetime, timedelta, timezone
+from statistics import mean
+from time import perf_counter
+
+from peewee import chunked
+
+from app import constants, clock
+from app.clock import VirtualClock
+from app.config import db
+from app.locks import write_transaction
+from app.orm_models.models import Member, ChatConfig, TenderParticipant, PollHistory, MemberStats, PollClose, \
+    LeaderLease, BotState
+from app.orm_models.repo import ConfigRepo, MemberRepo, TenderParticipantRepo, PollCloseRepo, utc_now
+from app.utils import get_members_for_daily, get_daily_time_utc, set_schedule, resolve_poll_results, \
+    record_single_win
+
+
+def setup(chats: int, members: int):
+    """
+    Создаёт таблицы, конфигурации чатов и участников.
+    :param chats: Количество чатов
+    :param members: Количество участников в каждом чате
+    :return: Имена участников по идентификатору чата
+    """
+    db.create_tables([Member, ChatConfig, TenderParticipant, PollHistory, MemberStats, PollClose, LeaderLease,
+                      BotState])
+    rosters = {chat_id: [f'member-{chat_id}-{index}' for index in range(members)] for chat_id in range(1, chats + 1)}
+    with db.atomic():
+        for batch in chunked([{'chat_id': chat_id} for chat_id in rosters], constants.INSERT_BATCH_SIZE):
+            ChatConfig.insert_many(batch).execute()
+        for chat_id, names in rosters.items():
+            MemberRepo.add_members(chat_id, ({'full_name': name, 'can_participate': True, 'skip_until_date': None}
+                                             for name in names))
+    return rosters
+
+
+def create_poll(chat_id: int) -> tuple[str, list[Member]] | None:
+    """
+    Создаёт голосование в чате так же, как хэндлер /poll (без отправки в Telegram).
+    :param chat_id: Идентификатор чата
+    :return: Идентификатор голосования и участники либо None, если голосование не создано
+    """
+    with write_transaction():
+        if not ConfigRepo.can_organise_daily_poll(chat_id):
+            return None
+        members = get_members_for_daily(chat_id)
+        if len(members) == 1:
+            record_single_win(chat_id, members[0])
+            return None
+        poll_id = f'{clock.today().isoformat()}:{chat_id}'
+        TenderParticipantRepo.delete_participants(chat_id)
+        TenderParticipantRepo.add_participants(poll_id, members)
+        set_schedule(time=get_daily_time_utc(constants.DEFAULT_DAILY_HOURS, constants.DEFAULT_DAILY_MINUTES),
+                     chat_id=chat_id)
+        ConfigRepo.update_config(chat_id=chat_id,
+                                 last_daily_date=clock.today(),
+                                 last_poll_id=poll_id,
+                                 last_poll_message_id=1)
+    return poll_id, members
+
+
+def vote(poll_id: str, votes: dict[str, int]):
+    """
+    Записывает снимок голосов так же, как хэндлер обновлений голосования.
+    :param poll_id: Идентификатор голосования
+    :param votes: Количество голосов по имени участника
+    """
+    with write_transaction():
+        for full_name, voter_count in votes.items():
+            member = MemberRepo.get_member_by_full_name(full_name)
+            TenderParticipantRepo.update_participant_vote_count(poll_id, member, voter_count)
+
+
+def free(chat_id: int, full_name: str, until: date):
+    """
+    Освобождает участника от тендеров так же, как хэндлер /free.
+    :param chat_id: Идентификатор чата
+    :param full_name: Имя участника
+    :param until: Дата, до которой участник освобождён
+    """
+    with write_transaction():
+        MemberRepo.update_member(chat_id=chat_id, full_name=full_name, skip_until_date=until)
+
+
+def open_polls(rosters: dict[int, list[str]], rng: random.Random, voters: int, free_probability: float) -> int:
+    """
+    Проводит во всех чатах один день: создание голосования, голоса и освобождение
+    случайных участников теми же вызовами, что и хэндлеры /poll, обработка голосов
+    и /free, по транзакции на каждое действие.
+    :return: Количество созданных голосований
+    """
+    created = 0
+    for chat_id, names in rosters.items():
+        poll = create_poll(chat_id)
+        if poll:
+            poll_id, members = poll
+            vote(poll_id, {member.full_name: rng.randint(0, voters) for member in members})
+            created += 1
+        if rng.random() < free_probability:
+            free(chat_id, rng.choice(names), clock.today() + timedelta(days=rng.randint(1, 7)))
+    return created
+
+
+def close_due_polls() -> int:
+    """
+    Завершает голосования, время которых наступило, так же, как реплика-лидер по
+    расписанию (run_due_poll_closes и close_polls без отправки в Telegram).
+    :return: Количество завершённых голосований
+    """
+    closed = 0
+    now = utc_now()
+    with db.atomic():
+        chat_ids = PollCloseRepo.get_due(now)
+    for batch in chunked(chat_ids, constants.INSERT_BATCH_SIZE):
+        with write_transaction():
+            _, _, winners = resolve_poll_results(PollCloseRepo.pop_due(now, batch))
+        closed += len(winners)
+    return closed
+
+
+def fairness_report(rosters: dict[int, list[str]]):
+    """
+    Считает равномерность распределения побед внутри чатов: индекс Джайна
+    (1 - победы распределены поровну) и разброс побед между участниками.
+    :return: Средний и минимальный индекс Джайна, средний разброс побед
+    """
+    wins = {chat_id: {name: 0 for name in names} for chat_id, names in rosters.items()}
+    query = MemberStats.select(MemberStats.chat_id, Member.full_name, MemberStats.times_won).join(Member)
+    for chat_id, full_name, times_won in query.tuples():
+        wins[chat_id][full_name] = times_won
+    jain, spread = [], []
+    for chat_wins in wins.values():
+        values = list(chat_wins.values())
+        squares = sum(value * value for value in values)
+        jain.append(sum(values) ** 2 / (len(values) * squares) if squares else 1.0)
+        spread.append(max(values) - min(values))
+    return mean(jain), min(jain), mean(spread)
+
+
+def simulate(chats: int, members: int, days: int, voters: int, free_probability: float, seed: int):
+    """
+    Прогоняет чаты через ежедневные циклы голосований в виртуальном времени
+    и выводит пропускную способность и показатели равномерности.
+    """
+    rng = random.Random(seed)
+    # выбор участников в get_members_for_daily использует общий генератор
+    random.seed(seed)
+    virtual_clock = VirtualClock(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    clock.set_clock(virtual_clock)
+    rosters = setup(chats, members)
+
+    started_at = perf_counter()
+    created, closed = 0, 0
+    for day in range(days):
+        midnight = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=day)
+        virtual_clock.set(midnight)
+        created += open_polls(rosters, rng, voters, free_probability)
+        virtual_clock.set(midnight.replace(hour=constants.DEFAULT_DAILY_HOURS,
+                                           minute=constants.DEFAULT_DAILY_MINUTES) + timedelta(minutes=1))
+        closed += close_due_polls()
+    elapsed = perf_counter() - started_at
+
+    average_jain, min_jain, average_spread = fairness_report(rosters)
+    print(f'Чатов: {chats}, участников в чате: {members}, дней: {days}')
+    print(f'Создано голосований: {created}, завершено: {closed}, время: {elapsed:.2f} с '
+          f'({closed / elapsed:.0f} голосований/с, {days / elapsed:.1f} дней/с)')
+    print(f'Индекс Джайна по победам: средний {average_jain:.3f}, минимальный {min_jain:.3f}; '
+          f'средний разброс побед в чате: {average_spread:.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Симуляция ежедневных тендеров в виртуальном времени')
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--members', type=int, default=8)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--voters', type=int, default=10, help='максимум голосов за одного участника')
+    parser.add_argument('--free-probability', type=float, default=0.05,
+                        help='вероятность освобождения случайного участника в чате за день')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', default=':memory:', help='файл БД для симуляции (по умолчанию - в памяти)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s %(levelname)s:%(message)s')
+    db.init(args.db, pragmas={'journal_mode': 'wal', 'busy_timeout': 5000})
+    simulate(args.chats, args.members, args.days, args.voters, args.free_probability, args.seed)
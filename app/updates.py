@@ -0,0 +1,222 @@
+import json
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import sleep
+
+from telebot import apihelper
+from telebot.types import Update
+
+from app import constants
+from app.active_polls import active_polls
+from app.config import bot, db
+from app.orm_models.repo import BotStateRepo
+
+
+def load_offset() -> int:
+    """
+    Возвращает идентификатор последнего обработанного обновления из БД.
+    :return: Идентификатор обновления (0, если обновления ещё не обрабатывались)
+    """
+    with db.atomic():
+        return int(BotStateRepo.get(constants.UPDATE_OFFSET_STATE, '0'))
+
+
+def save_offset(update_id: int, carried: dict[str, dict] = None):
+    """
+    Сохраняет идентификатор последнего обработанного обновления и, если переданы,
+    перенесённые снимки голосований (в одной транзакции со смещением).
+    :param update_id: Идентификатор обновления
+    :param carried: Необработанные снимки голосований (исходный JSON) по идентификатору голосования
+    """
+    with db.atomic():
+        BotStateRepo.set(constants.UPDATE_OFFSET_STATE, str(update_id))
+        if carried is not None:
+            BotStateRepo.set(constants.UPDATE_CARRIED_POLLS_STATE, json.dumps(list(carried.values())))
+
+
+def load_carried() -> dict[str, dict]:
+    """
+    Возвращает снимки голосований, перенесённые при прошлой догонке очереди обновлений.
+    :return: Снимки голосований (исходный JSON) по идентификатору голосования
+    """
+    with db.atomic():
+        carried = json.loads(BotStateRepo.get(constants.UPDATE_CARRIED_POLLS_STATE, '[]'))
+    return {update['poll']['id']: update for update in carried}
+
+
+def poll_chat_id(poll_id: str) -> int | None:
+    """
+    Возвращает чат голосования по реестру активных голосований (неизвестное голосование
+    ищется в БД).
+    :param poll_id: Идентификатор голосования
+    :return: Идентификатор чата либо None, если голосование не активно
+    """
+    chat_id = active_polls.chat_id_of(poll_id)
+    if chat_id is None and active_polls.lookup(poll_id):
+        chat_id = active_polls.chat_id_of(poll_id)
+    return chat_id
+
+
+def update_chat_id(update: Update) -> int | None:
+    """
+    Возвращает чат, к которому относится обновление.
+    :param update: Обновление
+    :return: Идентификатор чата либо None, если чат неизвестен
+    """
+    if update.poll:
+        return poll_chat_id(update.poll.id)
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post \
+        or (update.callback_query and update.callback_query.message)
+    return message.chat.id if message else None
+
+
+def collapse_poll_updates(updates: list[Update]) -> list[Update]:
+    """
+    Оставляет для каждого голосования только последнее обновление: оно содержит
+    актуальное количество голосов по всем вариантам, предыдущие снимки не нужны.
+    Порядок остальных обновлений сохраняется, снимок голосования остаётся на месте
+    своего последнего появления.
+    :param updates: Обновления в порядке получения
+    :return: Обновления без устаревших снимков голосований
+    """
+    latest = {update.poll.id: update.update_id for update in updates if update.poll}
+    return [update for update in updates if not update.poll or latest[update.poll.id] == update.update_id]
+
+
+# потоки хэндлеров обновлений: обновления одного чата всегда выполняются одним потоком
+update_workers = ThreadPoolExecutor(max_workers=constants.UPDATE_WORKERS, thread_name_prefix='updates')
+
+
+def process_in_order(updates: list[Update]):
+    """
+    Передаёт обновления хэндлерам по одному в порядке получения (process_new_updates
+    группирует пачку по типам обновлений). Ошибка хэндлера не останавливает обработку
+    следующих обновлений.
+    :param updates: Обновления в порядке получения
+    """
+    for update in updates:
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            logging.error('Cannot process update (update_id=%s): %s', update.update_id, e)
+
+
+def dispatch(updates: list[Update]):
+    """
+    Выполняет хэндлеры пачки обновлений в пуле потоков и ждёт их завершения, поэтому
+    смещение сохраняется только после выполнения всех хэндлеров пачки. Обновления
+    распределяются по потокам по полосе чата: обновления одного чата выполняются одним
+    потоком в порядке получения, разные полосы - параллельно, и медленный запрос к
+    Telegram в одном чате не задерживает остальные.
+    :param updates: Обновления в порядке получения
+    """
+    stripes = defaultdict(list)
+    for update in updates:
+        chat_id = update_chat_id(update)
+        stripes[chat_id % constants.UPDATE_WORKERS if chat_id is not None else 0].append(update)
+    wait([update_workers.submit(process_in_order, stripe) for stripe in stripes.values()])
+
+
+def apply_updates(updates: list[Update]) -> int:
+    """
+    Передаёт обновления хэндлерам бота и после их выполнения сохраняет идентификатор
+    последнего из них.
+    :param updates: Обновления в порядке получения
+    :return: Идентификатор последнего обновления
+    """
+    collapsed = collapse_poll_updates(updates)
+    if len(collapsed) < len(updates):
+        logging.info('Collapsed %s updates to %s', len(updates), len(collapsed))
+    dispatch(collapsed)
+    last_update_id = updates[-1].update_id
+    save_offset(last_update_id)
+    return last_update_id
+
+
+def carry_poll_updates(page: list[dict], carried: dict[str, dict]) -> list[Update]:
+    """
+    Отбирает из пачки обновления для применения. Снимки голосований известных чатов
+    не применяются, а переносятся в carried, заменяя предыдущий снимок того же
+    голосования. Перед обновлением чата применяются перенесённые снимки голосований
+    этого чата, поэтому порядок обновлений внутри чата сохраняется.
+    :param page: Пачка обновлений (исходный JSON) в порядке получения
+    :param carried: Перенесённые снимки голосований по идентификатору голосования (изменяется)
+    :return: Обновления для применения в порядке получения
+    """
+    selected = []
+    for raw in page:
+        update = Update.de_json(json.dumps(raw))
+        chat_id = update_chat_id(update)
+        if update.poll and chat_id is not None:
+            # снимок переставляется в конец, чтобы перенесённые снимки шли в порядке получения
+            carried.pop(update.poll.id, None)
+            carried[update.poll.id] = raw
+            continue
+        if not update.poll:
+            flushed = [poll_id for poll_id in carried if chat_id is None or poll_chat_id(poll_id) == chat_id]
+            selected.extend(Update.de_json(json.dumps(carried.pop(poll_id))) for poll_id in flushed)
+        selected.append(update)
+    return selected
+
+
+def catch_up(offset: int) -> int:
+    """
+    Забирает накопившиеся за время простоя обновления большими пачками без ожидания.
+    Запрос следующей пачки подтверждает Telegram получение предыдущих обновлений, и
+    повторно они уже не будут выданы, поэтому каждая пачка применяется и смещение
+    сохраняется до запроса следующей. Снимки голосований схлопываются по всей очереди:
+    последний снимок каждого голосования переносится из пачки в пачку и сохраняется
+    в БД вместе со смещением, а применяется перед следующим обновлением того же чата
+    либо в конце очереди. После сбоя догонка продолжается с сохранённого смещения
+    с сохранёнными снимками.
+    :param offset: Идентификатор последнего обработанного обновления
+    :return: Идентификатор последнего обработанного обновления после догонки
+    """
+    carried = load_carried()
+    received, applied = 0, 0
+    while page := apihelper.get_updates(bot.token, offset=offset + 1, limit=constants.UPDATES_BATCH_LIMIT,
+                                        long_polling_timeout=0):
+        selected = carry_poll_updates(page, carried)
+        dispatch(selected)
+        offset = page[-1]['update_id']
+        save_offset(offset, carried)
+        received += len(page)
+        applied += len(selected)
+    if carried:
+        selected = [Update.de_json(json.dumps(raw)) for raw in carried.values()]
+        dispatch(selected)
+        applied += len(selected)
+        carried.clear()
+        save_offset(offset, carried)
+    if received:
+        logging.info('Caught up: applied %s of %s pending updates', applied, received)
+    return offset
+
+
+def run_polling():
+    """
+    Получает обновления Telegram через long polling начиная с сохранённого смещения.
+    После перезапуска сначала догоняет накопившуюся очередь обновлений.
+    """
+    # до окончания догонки обычный приём обновлений не начинается: иначе перенесённые
+    # снимки голосований были бы применены позже более новых
+    while True:
+        try:
+            offset = catch_up(load_offset())
+            break
+        except Exception as e:
+            logging.error('Cannot catch up pending updates: %s', e)
+            sleep(constants.UPDATES_RETRY_SECONDS)
+    logging.info('Start polling updates from update_id=%s', offset + 1)
+    while True:
+        try:
+            updates = bot.get_updates(offset=offset + 1,
+                                      limit=constants.UPDATES_BATCH_LIMIT,
+                                      timeout=constants.UPDATES_LONG_POLLING_TIMEOUT + 10,
+                                      long_polling_timeout=constants.UPDATES_LONG_POLLING_TIMEOUT)
+            if updates:
+                offset = apply_updates(updates)
+        except Exception as e:
+            logging.error('Cannot get updates: %s', e)
+            sleep(constants.UPDATES_RETRY_SECONDS)
@@ -1,15 +1,26 @@
+import csv
+import io
+import json
 import logging
+import re
 import shlex
-from datetime import datetime, timezone
-from threading import Thread
-from time import sleep
+from datetime import datetime, timedelta
+from functools import partial
+from time import monotonic, sleep
+from typing import Iterator
 
-from peewee import DatabaseError
+from peewee import DatabaseError, chunked
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from app import constants
-from app.config import scheduler, bot, db
+from app import constants, clock
+from app.active_polls import active_polls
+from app.locks import chat_locks, log_lock_stats, write_transaction
+from app.config import scheduler, bot, db, history_retention_days, replica_id
+from app.leader import holds_leadership
 from app.orm_models.models import ChatConfig, Member
-from app.orm_models.repo import ConfigRepo, TenderParticipantRepo, MemberRepo
+from app.orm_models.repo import ConfigRepo, TenderParticipantRepo, MemberRepo, PollHistoryRepo, PollCloseRepo, \
+    utc_now
+from app.sender import send_all, call_with_retry
 
 
 def extract_args(text: str, count: int = None) -> list[str] | None:
@@ -35,6 +46,20 @@ def extract_args(text: str, count: int = None) -> list[str] | None:
     return args
 
 
+def extract_names(text: str) -> list[str]:
+    """
+    Получает имена пользователей из команды. Несколько имён разделяются переводом
+    строки или запятой, поэтому имена с пробелами не разбиваются на части.
+    :param text: Строка вида '/command имя1, имя2' либо с именами на отдельных строках
+    :return: Список непустых имён без кавычек
+    """
+    parts = text.split(maxsplit=1)
+    if len(parts) < 2:
+        return []
+    names = (name.replace('"', '').strip() for name in re.split('[\n,]', parts[1]))
+    return [name for name in names if name]
+
+
 def get_daily_time_utc(hours: int, minutes: int):
     """
     Возвращает сегодняшнюю дату по UTC с конкретным временем (часы и минуты).
@@ -42,8 +67,8 @@ def get_daily_time_utc(hours: int, minutes: int):
     :param minutes: Минуты
     :return: Объект времени
     """
-    now = datetime.now(tz=timezone.utc)
-    daily_time = now.replace(hour=hours, minute=minutes, second=0)
+    now = clock.now()
+    daily_time = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
     if daily_time < now:
         daily_time_str = daily_time.strftime('%H:%M')
         now_str = now.strftime('%H:%M')
@@ -53,49 +78,182 @@ def get_daily_time_utc(hours: int, minutes: int):
     return daily_time
 
 
-def schedule_checker():
+def scheduler_loop():
     """
-    Проверяет и запускает отложенные задачи
+    Цикл выполнения отложенных задач. Запускать в отдельном потоке на каждой реплике.
+    Завершение голосований и периодические задачи выполняет только лидер; аренду
+    лидерства продлевает отдельный поток (см. lease_heartbeat), поэтому долгие задачи
+    не приводят к её истечению. Статистика ожидания блокировок чатов пишется в лог
+    на каждой реплике.
     """
-    logging.info('Start of schedule loop to execute jobs on separate thread')
-    while len(scheduler.get_jobs()) > 0:
-        scheduler.exec_jobs()
-        sleep(1)
-    logging.info('Schedule loop shut down successfully')
+    logging.info('Start of scheduler loop (replica=%s)', replica_id)
+    stats_logged_at = monotonic()
+    while True:
+        try:
+            if holds_leadership():
+                run_due_poll_closes()
+                scheduler.exec_jobs()
+            if monotonic() - stats_logged_at >= constants.CHAT_LOCK_STATS_INTERVAL_SECONDS:
+                stats_logged_at = monotonic()
+                log_lock_stats()
+        except Exception as e:
+            logging.error('Scheduler loop iteration failed: %s', e)
+        sleep(constants.SCHEDULER_TICK_SECONDS)
+
+
+def run_due_poll_closes():
+    """
+    Завершает пачками голосования, время завершения которых наступило. Перед каждой
+    пачкой проверяется, что реплика всё ещё является лидером.
+    """
+    now = utc_now()
+    with db.atomic():
+        chat_ids = PollCloseRepo.get_due(now)
+    for batch in chunked(chat_ids, constants.INSERT_BATCH_SIZE):
+        if not holds_leadership():
+            logging.warning('Replica %s is not the scheduler leader anymore, leaving due poll closes to the new '
+                            'leader', replica_id)
+            return
+        close_polls(batch, due_at=now)
 
 
 def set_schedule(time: datetime, chat_id: int):
     """
-    Создаёт отложенную задачу в отдельном потоке. Удаляет до этого созданные
-    задачи.
+    Планирует завершение голосования чата (в БД, чтобы его выполнила реплика-лидер).
+    Заменяет до этого запланированное завершение голосования этого чата.
+    Голосования с одинаковым временем завершения закрываются одной пачкой.
     :param time: Время
     :param chat_id: Идентификатор чата
     :return:
     """
-    logging.info("Setting schedule to check poll results to time (UTC): {}"
-                 .format(time.strftime('%d/%m/%Y %H:%M:%S')))
-    scheduler.once(time, check_poll_results, kwargs={"chat_id": chat_id})
-    Thread(target=schedule_checker).start()
+    time = time.replace(second=0, microsecond=0)
+    logging.info("Setting schedule to check poll results to time (UTC): %s", time.strftime('%d/%m/%Y %H:%M:%S'),
+                 extra={'chat_id': chat_id})
+    PollCloseRepo.schedule(chat_id, time)
 
 
-def check_poll_results(chat_id: int):
+def cancel_schedule(chat_id: int):
+    """
+    Отменяет запланированное завершение голосования чата, не затрагивая другие чаты.
+    :param chat_id: Идентификатор чата
     """
-    Вызывается как отложенный метод, выполняет проверку результатов
-    голосования на проведение дейли.
+    PollCloseRepo.cancel(chat_id)
+
+
+def announce_winner(chat_id: int, poll_message_id: int, full_name: str):
+    """
+    Отправляет сообщение о победителе и останавливает голосование.
     :param chat_id: Идентификатор чата
+    :param poll_message_id: Идентификатор сообщения с голосованием
+    :param full_name: Имя победителя
     """
-    with db.atomic() as transaction:
+    call_with_retry(bot.send_message, chat_id, constants.WIN_MESSAGE_TEMPLATE.format(full_name))
+    call_with_retry(bot.stop_poll, chat_id, poll_message_id)
+
+
+def resolve_poll_results(chat_ids: list[int]):
+    """
+    Определяет победителей голосований нескольких чатов одним запросом, отмечает
+    победителей и архивирует голосования пачкой. Вызывать в транзакции.
+    :param chat_ids: Идентификаторы чатов
+    :return: Конфигурации чатов по идентификатору голосования, уже завершённые голосования
+    и победители по идентификатору голосования
+    """
+    configs: list[ChatConfig] = ConfigRepo.get_configs(chat_ids)
+    polls: dict[str, ChatConfig] = {c.last_poll_id: c for c in configs if c.last_poll_id}
+    archived = PollHistoryRepo.get_archived_poll_ids(list(polls))
+    winners = TenderParticipantRepo.get_most_voted_participants([p for p in polls if p not in archived])
+    MemberRepo.mark_winners([winner.member.id for winner in winners.values()])
+    PollHistoryRepo.archive_polls(winners)
+    return polls, archived, winners
+
+
+def close_polls(chat_ids: list[int], due_at: datetime = None):
+    """
+    Завершает голосования нескольких чатов: победители определяются одним запросом,
+    статусы победителей и архив обновляются пачкой в одной транзакции, после чего
+    сообщения о победителях параллельно рассылаются через пул отправки.
+    :param chat_ids: Идентификаторы чатов
+    :param due_at: Время (UTC), на которое наступили запланированные завершения. Если указано,
+    завершения забираются из расписания в той же транзакции, а при ошибке переносятся на повтор
+    """
+    logging.info('Closing polls of %s chats in one batch', len(chat_ids))
+    error_template = 'Произошла ошибка при получении результатов голосования: {}'
+    error = None
+    # блокировка на запись с начала транзакции: другая реплика не заберёт те же завершения
+    with chat_locks.hold(*chat_ids), write_transaction() as transaction:
         try:
-            config: ChatConfig = ConfigRepo.get_config(chat_id=chat_id)
-            poll_id: str = config.last_poll_id
-            poll_message_id: str = config.last_poll_message_id
-            winner: Member = TenderParticipantRepo.get_most_voted_participant(poll_id).member
-            bot.send_message(chat_id, constants.WIN_MESSAGE_TEMPLATE.format(winner.full_name))
-            bot.stop_poll(chat_id, poll_message_id)
-            MemberRepo.update_member(chat_id=chat_id, full_name=winner.full_name, can_participate=False)
+            if due_at is not None:
+                chat_ids = PollCloseRepo.pop_due(due_at, chat_ids)
+                if not chat_ids:
+                    return
+            polls, archived, winners = resolve_poll_results(chat_ids)
         except Exception as e:
             transaction.rollback()
-            bot.send_message(chat_id, f"Произошла ошибка при получении результатов голосования: {e}")
+            logging.error('Cannot close polls of %s chats: %s', len(chat_ids), e)
+            if due_at is not None:
+                PollCloseRepo.postpone(chat_ids, due_at + timedelta(seconds=constants.POLL_CLOSE_RETRY_SECONDS))
+            error = e
+
+    # сообщения отправляются после освобождения блокировок чатов и фиксации транзакции
+    if error is not None:
+        send_all({chat_id: partial(call_with_retry, bot.send_message, chat_id, error_template.format(error))
+                  for chat_id in chat_ids})
+        return
+
+    # реестр меняется только после фиксации транзакции
+    active_polls.discard(*polls)
+    tasks = {chat_id: partial(call_with_retry, bot.send_message, chat_id,
+                              error_template.format('не найдена конфигурация чата или голосование'))
+             for chat_id in chat_ids}
+    for poll_id, config in polls.items():
+        chat_id = config.chat_id
+        if poll_id in archived:
+            logging.warning('Poll (poll_id=%s) is already closed', poll_id,
+                            extra={'chat_id': chat_id, 'poll_id': poll_id})
+            tasks[chat_id] = partial(call_with_retry, bot.send_message, chat_id, 'Голосование уже завершено')
+        elif poll_id in winners:
+            tasks[chat_id] = partial(announce_winner, chat_id, config.last_poll_message_id,
+                                     winners[poll_id].member.full_name)
+        else:
+            logging.error('Cannot retrieve winner of poll (poll_id=%s)', poll_id,
+                          extra={'chat_id': chat_id, 'poll_id': poll_id})
+            tasks[chat_id] = partial(call_with_retry, bot.send_message, chat_id,
+                                     error_template.format('не найдено участников голосования'))
+    send_all(tasks)
+
+
+def check_poll_results(chat_id: int):
+    """
+    Выполняет проверку результатов голосования на проведение дейли одного чата.
+    :param chat_id: Идентификатор чата
+    """
+    close_polls([chat_id])
+
+
+def prune_history():
+    """
+    Периодическая задача: удаляет записи архива голосований старше срока хранения
+    (HISTORY_RETENTION_DAYS).
+    """
+    try:
+        with db.atomic():
+            PollHistoryRepo.prune_history(clock.today() - timedelta(days=history_retention_days))
+    except Exception as e:
+        logging.error('Cannot prune poll history: %s', e)
+
+
+def record_single_win(chat_id: int, winner: Member):
+    """
+    Записывает победу единственного доступного участника без голосования: участник
+    выбывает из следующих тендеров, победа попадает в архив, а тендер считается
+    проведённым сегодня (иначе повторный /poll в тот же день снова засчитал бы победу).
+    :param chat_id: Идентификатор чата
+    :param winner: Победитель
+    """
+    MemberRepo.update_member(chat_id, winner.full_name, can_participate=False)
+    PollHistoryRepo.archive_single_win(chat_id, winner)
+    ConfigRepo.update_config(chat_id=chat_id, last_daily_date=clock.today())
 
 
 def get_members_for_daily(chat_id):
@@ -158,3 +316,117 @@ def try_parse_date(date_string):
         except ValueError:
             pass
     raise ValueError('no valid date format found')
+
+
+def parse_bool(value) -> bool:
+    """
+    Возвращает булево значение из строки файла импорта.
+    :param value: Значение ("1", "true", "да" и т.п.) либо bool
+    :return: Булево значение
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'да', '+')
+
+
+def make_roster_row(full_name, can_participate=None, skip_until_date=None) -> dict | None:
+    """
+    Формирует строку для добавления пользователя из значений файла импорта.
+    :param full_name: Имя пользователя
+    :param can_participate: Возможность участия (по умолчанию True)
+    :param skip_until_date: Дата, до которой пропускается участие
+    :return: Словарь полей пользователя либо None, если имя пустое
+    """
+    full_name = str(full_name or '').replace('"', '').strip()
+    if not full_name:
+        return None
+    return {'full_name': full_name,
+            'can_participate': True if can_participate in (None, '') else parse_bool(can_participate),
+            'skip_until_date': try_parse_date(str(skip_until_date).strip()) if skip_until_date else None}
+
+
+def parse_roster_file(content: bytes, file_name: str) -> Iterator[dict]:
+    """
+    Построчно разбирает файл со списком пользователей. Поддерживается CSV (первая колонка -
+    имя, либо заголовок с колонками full_name, can_participate, skip_until_date) и JSON
+    (список имён или объектов с теми же полями).
+    :param content: Содержимое файла
+    :param file_name: Имя файла (по расширению определяется формат)
+    :return: Итератор словарей с полями пользователей
+    """
+    if file_name.lower().endswith('.json'):
+        items = json.loads(content.decode('utf-8-sig'))
+        if not isinstance(items, list):
+            raise ValueError('JSON-файл должен содержать список пользователей')
+        for index, item in enumerate(items, 1):
+            if isinstance(item, dict) and 'full_name' not in item:
+                raise ValueError('В элементе №{} JSON-файла нет поля full_name'.format(index))
+            row = make_roster_row(**{k: v for k, v in item.items() if k in constants.ROSTER_FIELDS}) \
+                if isinstance(item, dict) else make_roster_row(item)
+            if row:
+                yield row
+        return
+
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig', newline=''))
+    header = None
+    for index, values in enumerate(reader):
+        if not values:
+            continue
+        if index == 0 and values[0].strip().lower() in constants.ROSTER_FIELDS:
+            header = [v.strip().lower() for v in values]
+            if 'full_name' not in header:
+                raise ValueError('В заголовке CSV-файла нет колонки full_name (колонки: {})'
+                                 .format(', '.join(constants.ROSTER_FIELDS)))
+            continue
+        fields = {k: v for k, v in zip(header, values) if k in constants.ROSTER_FIELDS} if header \
+            else {'full_name': values[0]}
+        row = make_roster_row(**fields)
+        if row:
+            yield row
+
+
+def write_roster_csv(rows) -> io.BytesIO:
+    """
+    Записывает список пользователей в CSV-файл в памяти, построчно потребляя итератор.
+    :param rows: Итератор кортежей (имя, возможность участия, дата пропуска)
+    :return: Файл в памяти, готовый к отправке
+    """
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(constants.ROSTER_FIELDS)
+    for full_name, can_participate, skip_until_date in rows:
+        writer.writerow([full_name, int(can_participate), str(skip_until_date) if skip_until_date else ''])
+    text.flush()
+    text.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def render_members_page(chat_id: int, after_id: int = None, before_id: int = None):
+    """
+    Формирует страницу списка участников тендера и кнопки перехода между страницами.
+    :param chat_id: Идентификатор чата
+    :param after_id: Показать участников после указанного id (следующая страница)
+    :param before_id: Показать участников до указанного id (предыдущая страница)
+    :return: Текст сообщения и клавиатура (None, если страница одна)
+    """
+    rows, has_more = MemberRepo.get_members_page(chat_id, after_id=after_id, before_id=before_id)
+    if not rows:
+        logging.error("Cannot get members: no users in db (chat id=%s)", chat_id, extra={'chat_id': chat_id})
+        raise DatabaseError("Не найдено участников тендера в базе данных")
+
+    lines = ['Встречайте участников тендера:']
+    lines.extend(f'{Member.status_emoji(can_participate, skip_until_date)} {full_name} '
+                 f'(id={member_id}{Member.availability_text(can_participate, skip_until_date)})'
+                 for member_id, full_name, can_participate, skip_until_date in rows)
+
+    has_prev = has_more if before_id is not None else after_id is not None
+    has_next = has_more if before_id is None else True
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton('◀', callback_data=f'{constants.INFO_CALLBACK_PREFIX}:prev:{rows[0][0]}'))
+    if has_next:
+        buttons.append(InlineKeyboardButton('▶', callback_data=f'{constants.INFO_CALLBACK_PREFIX}:next:{rows[-1][0]}'))
+    markup = InlineKeyboardMarkup().row(*buttons) if buttons else None
+    return '\n'.join(lines), markup